@@ -4,8 +4,8 @@ Script to determine which PRs in [chisel-releases](https://github.com/canonical/
 missing forward ports to future releases, and therefore which PRs should be labeled with "forward port missing"
 (and which should have that label removed).
 
-The script checks out chisel-releases to determine which releases are supported, and what slices are currently
-present in each release. Then it makes a bunch of calls to the GitHub API to fetch the data about PRs, and what new
+The script clones chisel-releases (without checking it out) to determine which releases are supported, and what
+slices are currently present in each release. Then it makes a bunch of calls to the GitHub API to fetch the data about PRs, and what new
 slices do they introduce. Finally, to determine the PR status, for each PR we check whether the slices introduced
 by that particular PR are either already present in the future release, or are being introduced by another PR.
 Any slices for any discontinued packages are ignored.
@@ -18,16 +18,20 @@ from pathlib import Path
 import argparse
 import tempfile
 import datetime
+import hashlib
+import json
 import gzip
 import io
 import logging
 import os
 import re
+import threading
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 from itertools import product
 import subprocess as sub
 from dataclasses import dataclass
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 import time
 from typing import Iterator, Callable
 
@@ -35,10 +39,8 @@ from diff_parser import Diff
 import requests
 import yaml
 
-# For dev you can use requests-cache to cache the
-# GitHub API responses and avoid hitting rate limits:
-# import requests_cache
-# requests_cache.install_cache("requests_cache")
+# With --cache-dir, the GitHub API responses and the package lists are kept in an
+# on-disk HTTP cache (see HttpCache), which also helps avoiding rate limits in dev.
 
 FORWARD_PORT_MISSING_LABEL = "forward port missing"
 
@@ -65,6 +67,177 @@ def timing_context() -> Iterator[Callable[[], float]]:
     t2 = time.perf_counter()
 
 
+class HttpCache:
+    """On-disk cache of HTTP GET responses. Responses younger than their TTL are served
+    from the cache, older ones are revalidated with a conditional request (If-None-Match /
+    If-Modified-Since) and only downloaded again if they changed. GitHub does not count
+    304 responses against the rate limit. Once the cache grows over max_bytes, the least
+    recently used responses are evicted. With a transform, only the transformed body of
+    the responses is kept, and returned, for callers which only need part of it."""
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        transform: Callable[[bytes], bytes] | None = None,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.transform = transform
+        self.counts: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def _path(self, url: str, params: dict | None, headers: dict | None) -> Path:
+        # the Authorization header is not part of the key, since the token changes every run
+        accept = (headers or {}).get("Accept", "")
+        key = json.dumps([url, sorted((params or {}).items()), accept], default=str)
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()
+
+    def get(
+        self,
+        session: requests.Session,
+        url: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+        ttl: float = 0,
+    ) -> requests.Response:
+        path = self._path(url, params, headers)
+        meta_path, body_path = path.with_suffix(".json"), path.with_suffix(".body")
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            meta, body = None, b""
+
+        headers = dict(headers or {})
+        if meta is not None:
+            if time.time() - meta["stored_at"] < ttl:
+                self._count("hits")
+                os.utime(meta_path)
+                return self._response(url, meta, body)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = session.get(url, params=params, headers=headers)
+        if response.status_code == 304 and meta is not None:
+            self._count("revalidated")
+            meta["stored_at"] = time.time()
+            self._write(meta_path, json.dumps(meta).encode())
+            return self._response(url, meta, body)
+        self._count("misses")
+        if response.status_code == 200 and (
+            ttl or "ETag" in response.headers or "Last-Modified" in response.headers
+        ):
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_type": response.headers.get("Content-Type"),
+                "encoding": response.encoding,
+                "stored_at": time.time(),
+            }
+            if self.transform is not None:
+                response._content = self.transform(response.content)
+            self._write(body_path, response.content)
+            self._write(meta_path, json.dumps(meta).encode())
+            self._evict()
+        return response
+
+    @staticmethod
+    def _response(url: str, meta: dict, body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = body
+        response.encoding = meta.get("encoding")
+        if meta.get("content_type"):
+            response.headers["Content-Type"] = meta["content_type"]
+        return response
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for meta_path in self.directory.glob("*.json"):
+                body_path = meta_path.with_suffix(".body")
+                try:
+                    size = meta_path.stat().st_size + body_path.stat().st_size
+                    used_at = meta_path.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((used_at, size, meta_path, body_path))
+                total += size
+            for _, size, meta_path, body_path in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                meta_path.unlink(missing_ok=True)
+                body_path.unlink(missing_ok=True)
+                total -= size
+                self.counts["evicted"] += 1
+
+    def summary(self, since: Counter[str] | None = None) -> str:
+        counts = self.counts - (since or Counter())
+        return (
+            f"HTTP cache: {counts['hits']} hits, {counts['revalidated']} revalidated, "
+            f"{counts['misses']} misses, {counts['evicted']} evicted"
+        )
+
+
+# HTTP cache of the run, if any, used by http_get()
+_http_cache: HttpCache | None = None
+
+# HTTP cache of the Packages.gz files, which only keeps their package names (see
+# _package_names_only()), since the whole files are much larger than everything else
+_packages_cache: HttpCache | None = None
+
+# How long the Packages.gz files are served from the cache without revalidation
+PACKAGES_TTL = 60 * 60
+
+
+def http_get(
+    session: requests.Session,
+    url: str,
+    params: dict | None = None,
+    headers: dict | None = None,
+    ttl: float = 0,
+    cache: HttpCache | None = None,
+) -> requests.Response:
+    """GET url with the session, through the given HTTP cache, or the HTTP cache of the
+    run if there is one."""
+    cache = cache or _http_cache
+    if cache is None:
+        return session.get(url, params=params, headers=headers)
+    return cache.get(session, url, params=params, headers=headers, ttl=ttl)
+
+
+def _cache_summary(
+    since: Counter[str] | None = None, cache: HttpCache | None = None
+) -> str:
+    """Return the HTTP cache statistics since the given counts, for the timing logs."""
+    cache = cache or _http_cache
+    if cache is None:
+        return ""
+    return f" ({cache.summary(since)})"
+
+
+def _cache_counts(cache: HttpCache | None = None) -> Counter[str] | None:
+    cache = cache or _http_cache
+    return cache.counts.copy() if cache is not None else None
+
+
 @dataclass(frozen=True)
 class PR:
     number: int
@@ -82,9 +255,28 @@ class PR:
         )
 
 
-def fetch_prs(supported_branches: set[str] | None = None) -> set[PR]:
+# Where fetch_prs() reads the new slices of each PR from
+PR_BACKENDS = ("files", "diff")
+
+# GitHub lists at most this many files of a PR, the diff is needed beyond that
+PR_FILES_LIMIT = 3000
+
+
+def fetch_prs(
+    supported_branches: set[str] | None = None,
+    cache_dir: Path | None = None,
+    backend: str = "files",
+) -> set[PR]:
     """Fetch the list of open PRs into 'ubuntu-XX.XX' branches in chisel-releases which correspond to
-    the supported Ubuntu releases. For each PR determine the set of new slices it introduces"""
+    the supported Ubuntu releases. For each PR determine the set of new slices it introduces.
+
+    With a cache_dir, the new slices of each PR are kept there, keyed by the SHA of the head of
+    the PR, so that only the PRs whose head moved since the last call are fetched again.
+
+    The new slices are read from the list of files of each PR with the "files" backend, and from
+    its whole diff with the "diff" backend. The latter is also used for the PRs whose files could
+    not be listed."""
+    assert backend in PR_BACKENDS, f"Unknown PR backend: {backend!r}"
     url = "https://api.github.com/repos/canonical/chisel-releases/pulls"
     headers: dict[str, str] = {
         "Accept": "application/vnd.github.v3+json",
@@ -100,7 +292,7 @@ def fetch_prs(supported_branches: set[str] | None = None) -> set[PR]:
     results: list[dict] = []
     with requests.Session() as s:
         while True:
-            response = s.get(url, params=params, headers=headers)
+            response = http_get(s, url, params=params, headers=headers)
             response.raise_for_status()
             parsed_result = response.json()
             assert isinstance(parsed_result, list), (
@@ -126,46 +318,125 @@ def fetch_prs(supported_branches: set[str] | None = None) -> set[PR]:
     # run the generator
     results = list(_results)
 
-    # fetch the diff for each PR in parallel and determine which slices they are modifying (i.e. which files in the /slices directory they are adding/modifying)
+    # reuse the new slices of the PRs whose head and base branch did not move
+    cache_path = cache_dir / "pr-new-slices.json" if cache_dir is not None else None
+    cached: dict[str, dict] = {}
+    if cache_path is not None and cache_path.exists():
+        cached = json.loads(cache_path.read_text())
+
+    def _head_sha(pr: dict) -> str | None:
+        return pr.get("head", {}).get("sha")
 
-    def _fetch_diff(pr: dict) -> tuple[int, Diff | None]:
-        """Fetch a PR's diff and return the PR number and the parsed Diff object."""
+    to_fetch: list[dict] = []
+    for result in results:
+        entry = cached.get(str(result["number"]))
+        if (
+            entry
+            and _head_sha(result)
+            and entry["head"] == _head_sha(result)
+            and entry.get("base") == result["base"]["ref"]
+        ):
+            result["new_slices"] = entry["new_slices"]
+        else:
+            to_fetch.append(result)
+
+    # fetch the new slices of each PR in parallel (i.e. which files in the /slices directory they are adding)
+
+    def _is_slice_file(path: str) -> bool:
+        filepath = Path(path)
+        return filepath.parent.name == "slices" and filepath.suffix == ".yaml"
+
+    def _fetch_diff(pr: dict) -> list[str] | None:
+        """Fetch a PR's diff and return the slices it adds, or None if the diff could not be fetched."""
         with requests.Session() as s:
-            response = s.get(pr["diff_url"], headers=headers)
+            response = http_get(s, pr["diff_url"], headers=headers)
             response.raise_for_status()
         diff_text = response.text
-        pr_number = pr["number"]
         if "<h1>Too many requests</h1>" in diff_text:
             warn(
-                f"Rate limit exceeded when fetching diff for PR #{pr_number}. Skipping."
+                f"Rate limit exceeded when fetching diff for PR #{pr['number']}. Skipping."
             )
-            return pr_number, None
-        return pr_number, Diff(diff_text)
+            return None
+        if not diff_text:
+            return None
 
+        new_slices: set[str] = set()
+        for block in Diff(diff_text):
+            if block.type == "new" and _is_slice_file(block.new_filepath):
+                new_slices.add(Path(block.new_filepath).stem)
+        return sorted(new_slices)
+
+    def _fetch_files(pr: dict) -> list[str] | None:
+        """List a PR's files and return the slices it adds, or None if the list is incomplete.
+
+        Only the name and status of each file are used, so this is much lighter than the diff.
+        GitHub stops listing the files of a PR after PR_FILES_LIMIT of them."""
+        files_url = f"{url}/{pr['number']}/files"
+        files_params: dict[str, str | int] = {"per_page": per_page, "page": 1}
+        new_slices: set[str] = set()
+        listed = 0
+        with requests.Session() as s:
+            while True:
+                response = http_get(s, files_url, params=files_params, headers=headers)
+                if not response.ok:
+                    return None
+                files = response.json()
+                assert isinstance(files, list), "Expected response to be a list of files."
+                listed += len(files)
+                for file in files:
+                    if file["status"] == "added" and _is_slice_file(file["filename"]):
+                        new_slices.add(Path(file["filename"]).stem)
+                if len(files) < per_page:
+                    break
+                files_params["page"] += 1  # type: ignore[operator]
+        if listed >= PR_FILES_LIMIT:
+            return None
+        return sorted(new_slices)
+
+    def _fetch_new_slices(pr: dict) -> tuple[int, list[str] | None]:
+        new_slices = _fetch_files(pr) if backend == "files" else None
+        if new_slices is None:
+            # the diff backend is the fallback when the files cannot be listed
+            new_slices = _fetch_diff(pr)
+        return pr["number"], new_slices
+
+    counts = _cache_counts()
     with timing_context() as elapsed:
         with ThreadPoolExecutor(max_workers=5) as executor:
-            _diffs = list(executor.map(_fetch_diff, results))
-    diffs: dict[int, Diff | None] = dict(_diffs)
+            fetched: dict[int, list[str] | None] = dict(
+                executor.map(_fetch_new_slices, to_fetch)
+            )
 
-    info(f"Fetched diffs for {len(results)} PRs in {elapsed():.2f} seconds.")
+    info(
+        f"Fetched the new slices of {len(to_fetch)} PRs from their {backend} in {elapsed():.2f} seconds "
+        f"({len(results) - len(to_fetch)} unchanged PRs reused).{_cache_summary(counts)}"
+    )
 
-    # for each PR patch in a field "new_slices" based on the fetched diff
-    for result in results:
-        diff = diffs.get(result["number"])
-        if not diff:
-            warn(f"Could not fetch diff for PR #{result['number']}. Skipping.")
+    # for each PR patch in a field "new_slices" based on the fetched files or diff
+    for result in to_fetch:
+        new_slices = fetched.get(result["number"])
+        if new_slices is None:
+            warn(f"Could not fetch the new slices of PR #{result['number']}. Skipping.")
             continue
-
-        new_slices: set[str] = set()
-        for block in diff:
-            if block.type == "new":
-                new_filepath = Path(block.new_filepath)
-                if (
-                    new_filepath.parent.name == "slices"
-                    and new_filepath.suffix == ".yaml"
-                ):
-                    new_slices.add(new_filepath.stem)
-        result["new_slices"] = sorted(new_slices)
+        result["new_slices"] = new_slices
+
+    if cache_path is not None:
+        # only keep the open PRs whose new slices could be fetched
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(
+            json.dumps(
+                {
+                    str(r["number"]): {
+                        "head": _head_sha(r),
+                        "base": r["base"]["ref"],
+                        "new_slices": r["new_slices"],
+                    }
+                    for r in results
+                    if _head_sha(r) and "new_slices" in r
+                },
+                indent=1,
+            )
+        )
 
     return set(PR.from_github_json(r) for r in results if r.get("new_slices"))
 
@@ -174,6 +445,16 @@ def fetch_prs(supported_branches: set[str] | None = None) -> set[PR]:
 _PACKAGE_RE = re.compile(r"^Package:\s*(\S+)", re.MULTILINE)
 
 
+def _package_names_only(content: bytes) -> bytes:
+    """Strip a Packages.gz file down to its "Package:" lines, still gzipped, which is all
+    fetch_packages_in_release() reads. This is a few MB for all the releases instead of
+    ~150MB, small enough to keep the package lists between runs."""
+    with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
+        text = f.read().decode("utf-8")
+    lines = (f"Package: {m.group(1)}\n" for m in _PACKAGE_RE.finditer(text))
+    return gzip.compress("".join(lines).encode())
+
+
 def fetch_packages_in_release(
     codenames: dict[str, str],  # ubuntu-XX.XX -> short codename (e.g. jammy)
 ) -> dict[str, set[str]]:
@@ -192,7 +473,7 @@ def fetch_packages_in_release(
         url = f"https://archive.ubuntu.com/ubuntu/dists/{name}/{component}/binary-amd64/Packages.gz"
 
         with requests.Session() as s:
-            response = s.get(url)
+            response = http_get(s, url, ttl=PACKAGES_TTL, cache=_packages_cache)
             response.raise_for_status()
 
         with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as f:
@@ -208,13 +489,17 @@ def fetch_packages_in_release(
     _repos = ("", "security", "updates", "backports")
 
     _product = list(product(codenames.values(), _components, _repos))
+    counts = _cache_counts(_packages_cache)
     with timing_context() as elapsed:
         with ThreadPoolExecutor(max_workers=5) as executor:
             results: list[tuple[str, set[str]]] = list(
                 executor.map(_fetch_packages, _product)
             )
 
-    info(f"Fetched packages for {len(codenames)} releases in {elapsed():.2f} seconds.")
+    info(
+        f"Fetched packages for {len(codenames)} releases in {elapsed():.2f} seconds."
+        f"{_cache_summary(counts, _packages_cache)}"
+    )
 
     # Union all components and repos for each release
     packages_by_release: dict[str, set[str]] = {
@@ -227,45 +512,225 @@ def fetch_packages_in_release(
     return packages_by_release
 
 
+def _git(repo: Path, *args: str, input: bytes | None = None) -> bytes:
+    """Run a git command in the given repository and return its stdout."""
+    return sub.run(
+        ["git", *args],
+        cwd=repo,
+        input=input,
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+def _fetch_missing_blobs(repo: Path, revs: list[str]) -> None:
+    """Fetch the blobs named by revs (e.g. "ubuntu-24.04:chisel.yaml") which are not in
+    the blobless clone at repo yet, in a single `git fetch` from its promisor remote.
+    Otherwise git fetches each of them on demand, with one round trip per blob. The blob
+    ids are read from the trees with `git ls-tree`, which unlike `git cat-file` does not
+    fetch them."""
+    wanted: set[str] = set()
+    for rev in revs:
+        tree, _, path = rev.partition(":")
+        for line in _git(repo, "ls-tree", tree, "--", path).decode().splitlines():
+            mode_type_oid, _ = line.split("\t", 1)
+            wanted.add(mode_type_oid.split()[2])
+    present = _git(
+        repo, "cat-file", "--batch-all-objects", "--batch-check=%(objectname)"
+    ).split()
+    missing = sorted(wanted - set(oid.decode() for oid in present))
+    if not missing:
+        return
+    _git(
+        repo,
+        "-c",
+        "fetch.negotiationAlgorithm=noop",
+        "fetch",
+        "--quiet",
+        "--no-tags",
+        "--no-write-fetch-head",
+        "--recurse-submodules=no",
+        "--filter=blob:none",
+        "origin",
+        *missing,
+    )
+
+
+def _cat_files(repo: Path, revs: list[str]) -> dict[str, bytes | None]:
+    """Read the contents of the objects named by revs (e.g. "ubuntu-24.04:chisel.yaml")
+    with a single `git cat-file --batch` process, once the missing blobs were fetched
+    together (see _fetch_missing_blobs()). Missing objects map to None."""
+    _fetch_missing_blobs(repo, revs)
+    batch = "".join(f"{rev}\n" for rev in revs).encode()
+    out = _git(repo, "cat-file", "--batch", input=batch)
+    contents: dict[str, bytes | None] = {}
+    pos = 0
+    for rev in revs:
+        eol = out.index(b"\n", pos)
+        header = out[pos:eol].split()
+        pos = eol + 1
+        if len(header) != 3:
+            # "<rev> missing" or "<rev> ambiguous"
+            contents[rev] = None
+            continue
+        size = int(header[2])
+        contents[rev] = out[pos : pos + size]
+        pos += size + 1  # the contents are followed by a newline
+    return contents
+
+
+def _slice_name(path: bytes) -> str | None:
+    """Return the name of the slice defined by a path like "slices/foo.yaml", if any."""
+    p = Path(path.decode())
+    if p.parent == Path("slices") and p.suffix == ".yaml":
+        return p.stem
+    return None
+
+
+def _list_slices(repo: Path, rev: str) -> set[str]:
+    """List the names of the slice definition files in the slices/ directory of a commit."""
+    out = _git(repo, "ls-tree", "--name-only", "-z", rev, "--", "slices/")
+    names = (_slice_name(n) for n in out.split(b"\0") if n)
+    return set(n for n in names if n is not None)
+
+
+def _update_slices(repo: Path, tip: str, snapshot: dict | None) -> set[str]:
+    """Return the slices at the given branch tip. If there is a snapshot of the slices at
+    a previous tip of the branch, reuse it if the tip did not move, or update it with the
+    slice definition files added and deleted since then."""
+    if snapshot is None:
+        return _list_slices(repo, tip)
+    slices = set(snapshot["slices"])
+    if snapshot["tip"] == tip:
+        return slices
+    try:
+        out = _git(
+            repo,
+            "diff",
+            "--name-status",
+            "--no-renames",
+            "-z",
+            snapshot["tip"],
+            tip,
+            "--",
+            "slices/",
+        )
+    except sub.CalledProcessError:
+        # the previous tip is not in the mirror anymore
+        return _list_slices(repo, tip)
+    fields = out.split(b"\0")
+    for status, path in zip(fields[0::2], fields[1::2]):
+        name = _slice_name(path)
+        if name is None:
+            continue
+        if status == b"D":
+            slices.discard(name)
+        else:
+            slices.add(name)
+    return slices
+
+
+def _clone_or_fetch(url: str, repo: Path) -> None:
+    """Make a bare, shallow and blobless clone of url at repo, or update the branches of
+    the clone if it already exists."""
+    if (repo / "HEAD").exists():
+        _git(
+            repo,
+            "fetch",
+            "--quiet",
+            "--prune",
+            "--filter=blob:none",
+            "--depth=1",
+            url,
+            "+refs/heads/*:refs/heads/*",
+        )
+        return
+    sub.run(
+        [
+            "git",
+            "clone",
+            "--bare",
+            "--filter=blob:none",
+            "--depth=1",
+            "--no-single-branch",
+            url,
+            repo,
+        ],
+        check=True,
+    )
+
+
 def checkout_chisel_releases_info(
     url: str = "https://github.com/canonical/chisel-releases",
+    cache_dir: Path | None = None,
 ) -> tuple[dict[str, set[str]], dict[str, str]]:
-    """Checkout chisel-releases and get the list of branches named "ubuntu-XX.XX"
-    to determine which Ubuntu releases we should consider. For each release branch,
-    parse the chisel.yaml to determine the short codename (e.g. "jammy"), and get
-    the list of slices currently present in that release."""
+    """Get the list of branches named "ubuntu-XX.XX" in chisel-releases to determine which
+    Ubuntu releases we should consider. For each release branch, parse the chisel.yaml to
+    determine the short codename (e.g. "jammy"), and get the list of slices currently
+    present in that release.
+
+    Nothing is checked out: the branches are read from the object database of a bare,
+    shallow and blobless clone, which only holds their commits and trees. The missing
+    chisel.yaml blobs are then fetched in a single `git fetch`, and read in a single
+    `git cat-file --batch`.
+
+    With a cache_dir, the clone is kept there and updated with `git fetch` on the next
+    call, along with a snapshot of the slices of each branch at its tip. The slices of
+    the branches whose tip did not move are reused, and those of the other branches are
+    updated from `git diff --name-status`."""
 
     slices_per_branch: dict[str, set[str]] = {}
     codenames: dict[str, str] = {}
-    with tempfile.TemporaryDirectory(prefix="chisel-releases-clone-") as _tmpdir:
-        tmpdir = Path(_tmpdir)
-        sub.run(
-            ["git", "clone", url, tmpdir],
-            check=True,
+    with ExitStack() as stack:
+        snapshots: dict[str, dict] = {}
+        if cache_dir is None:
+            repo_dir = Path(
+                stack.enter_context(
+                    tempfile.TemporaryDirectory(prefix="chisel-releases-clone-")
+                )
+            )
+            snapshot_path = None
+        else:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            repo_dir = cache_dir / "chisel-releases.git"
+            snapshot_path = cache_dir / "slices-snapshot.json"
+            if snapshot_path.exists():
+                snapshots = json.loads(snapshot_path.read_text())
+        _clone_or_fetch(url, repo_dir)
+        out = _git(
+            repo_dir,
+            "for-each-ref",
+            "--format=%(refname:short) %(objectname)",
+            "refs/heads/",
         )
-        out: list[str] = sub.run(
-            ["git", "branch", "--remote", "--format='%(refname:short)'"],
-            cwd=tmpdir,
-            check=True,
-            capture_output=True,
-            text=True,
-        ).stdout.splitlines()
-        out = [b.strip().strip("'") for b in out]
-        out = [b.removeprefix("origin/") for b in out]
-        branches = set(b for b in out if b.startswith("ubuntu-"))
+        tips = dict(line.split() for line in out.decode().splitlines())
+        branches = set(b for b in tips if b.startswith("ubuntu-"))
         if not branches:
             raise Exception("No ubuntu branches in chisel-releases")
 
+        slices_at_tip = {
+            b: _update_slices(repo_dir, tips[b], snapshots.get(b)) for b in branches
+        }
+        if snapshot_path is not None:
+            snapshot_path.write_text(
+                json.dumps(
+                    {
+                        b: {"tip": tips[b], "slices": sorted(slices_at_tip[b])}
+                        for b in sorted(branches)
+                    },
+                    indent=1,
+                )
+            )
+
+        chisel_yamls = _cat_files(repo_dir, [f"{b}:chisel.yaml" for b in sorted(branches)])
+
         # get slice names for each supported release branch
         for branch in branches:
-            _ = sub.run(
-                ["git", "checkout", branch],
-                cwd=tmpdir,
-                check=True,
-                capture_output=True,
-                text=True,
-            )
-            chisel_yaml: dict = yaml.safe_load((tmpdir / "chisel.yaml").read_text())
+            content = chisel_yamls[f"{branch}:chisel.yaml"]
+            if content is None:
+                warn(f"no chisel.yaml in '{branch}'")
+                continue
+            chisel_yaml: dict = yaml.safe_load(content)
             end_of_life: datetime.date = chisel_yaml.get("maintenance", {}).get(
                 "end-of-life"
             )
@@ -286,9 +751,7 @@ def checkout_chisel_releases_info(
                 )
                 continue
 
-            slices_per_branch[branch] = set(
-                sdf.stem for sdf in (tmpdir / "slices").glob("*.yaml")
-            )
+            slices_per_branch[branch] = slices_at_tip[branch]
             codenames[branch] = _codenames.pop()
 
     _branches = sorted(
@@ -386,10 +849,43 @@ def main() -> None:
         action="store_true",
         help="Apply label changes to PRs using the gh CLI. Without this flag, only prints the results.",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Directory where to keep the clone of chisel-releases, a snapshot of the slices of each branch, "
+        "the new slices of each PR and an HTTP cache between runs. Without it, everything is fetched from scratch.",
+    )
+    parser.add_argument(
+        "--http-cache-max-size",
+        type=int,
+        default=256,
+        help="Maximum size of the HTTP caches in --cache-dir, of the GitHub API responses and of "
+        "the package lists, each in MiB (default: 256).",
+    )
+    parser.add_argument(
+        "--pr-backend",
+        choices=PR_BACKENDS,
+        default="files",
+        help="Where to read the new slices of each PR from: its list of files, or its whole diff (default: files).",
+    )
     args = parser.parse_args()
 
-    slices_per_branch, codenames = checkout_chisel_releases_info()
-    prs = fetch_prs(set(slices_per_branch.keys()))
+    global _http_cache, _packages_cache
+    if args.cache_dir is not None:
+        _http_cache = HttpCache(
+            args.cache_dir / "http", max_bytes=args.http_cache_max_size * 1024 * 1024
+        )
+        _packages_cache = HttpCache(
+            args.cache_dir / "packages",
+            max_bytes=args.http_cache_max_size * 1024 * 1024,
+            transform=_package_names_only,
+        )
+
+    slices_per_branch, codenames = checkout_chisel_releases_info(cache_dir=args.cache_dir)
+    prs = fetch_prs(
+        set(slices_per_branch.keys()), cache_dir=args.cache_dir, backend=args.pr_backend
+    )
     packages_by_release = fetch_packages_in_release(codenames)
 
     to_add_label, to_remove_label = determine_forward_porting_status(
@@ -401,6 +897,11 @@ def main() -> None:
     print("add:", ",".join(map(str, sorted(to_add_label))))
     print("remove:", ",".join(map(str, sorted(to_remove_label))))
 
+    if _http_cache is not None:
+        info(_http_cache.summary())
+    if _packages_cache is not None:
+        info(f"Packages {_packages_cache.summary()}")
+
     if args.apply:
         apply_labels(to_add_label, to_remove_label)
 
@@ -8,6 +8,10 @@ import pytest
 import sys
 import os
 import gzip
+import json
+import subprocess
+import time
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 from textwrap import dedent
 from dataclasses import replace
@@ -16,6 +20,7 @@ from copy import deepcopy
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import forward_port_missing
+import requests
 
 
 def _mock_session_get(mock_session_class: MagicMock) -> MagicMock:
@@ -61,7 +66,7 @@ class TestFetchPRs:
 
         get = _mock_session_get(mock_session)
         get.side_effect = side_effects
-        prs = forward_port_missing.fetch_prs()
+        prs = forward_port_missing.fetch_prs(backend="diff")
 
         assert len(prs) == 1
         pr = next(iter(prs))
@@ -71,12 +76,12 @@ class TestFetchPRs:
 
         # check that supported_branches filtering works
         get.side_effect = side_effects
-        prs = forward_port_missing.fetch_prs({"ubuntu-20.04"})
+        prs = forward_port_missing.fetch_prs({"ubuntu-20.04"}, backend="diff")
         assert len(prs) == 1
         assert next(iter(prs)) == pr
 
         get.side_effect = side_effects
-        prs = forward_port_missing.fetch_prs({"ubuntu-22.04"})
+        prs = forward_port_missing.fetch_prs({"ubuntu-22.04"}, backend="diff")
         assert len(prs) == 0
 
     @patch("forward_port_missing.requests.Session")
@@ -90,7 +95,7 @@ class TestFetchPRs:
 
         get = _mock_session_get(mock_session)
         get.side_effect = side_effects
-        prs = forward_port_missing.fetch_prs()
+        prs = forward_port_missing.fetch_prs(backend="diff")
 
         assert len(prs) == 0, "Draft PRs should be ignored"
 
@@ -112,11 +117,168 @@ class TestFetchPRs:
 
         get = _mock_session_get(mock_session)
         get.side_effect = side_effects
-        prs = forward_port_missing.fetch_prs()
+        prs = forward_port_missing.fetch_prs(backend="diff")
 
         assert len(prs) == 0, "PRs that don't add new slices should be ignored"
 
 
+    @patch("forward_port_missing.requests.Session")
+    def test_cache_dir(self, mock_session: MagicMock, tmp_path: Path) -> None:
+        json_response = deepcopy(self.json_response)
+        json_response[0]["draft"] = False
+        json_response[0]["head"] = {"sha": "a" * 40}
+        get = _mock_session_get(mock_session)
+
+        get.side_effect = self.make_side_effects(json_response, self.diff_text)
+        prs = forward_port_missing.fetch_prs(cache_dir=tmp_path, backend="diff")
+        assert get.call_count == 2
+        assert next(iter(prs)).new_slices == frozenset(["foo"])
+
+        # the head did not move: the diff is not fetched again
+        get.reset_mock()
+        get.side_effect = self.make_side_effects(json_response, "")[:1]
+        assert forward_port_missing.fetch_prs(cache_dir=tmp_path, backend="diff") == prs
+        assert get.call_count == 1
+
+        # the head moved: the diff is fetched again
+        get.reset_mock()
+        json_response[0]["head"] = {"sha": "b" * 40}
+        diff_text = self.diff_text.replace("foo", "bar")
+        get.side_effect = self.make_side_effects(json_response, diff_text)
+        prs = forward_port_missing.fetch_prs(cache_dir=tmp_path, backend="diff")
+        assert get.call_count == 2
+        assert next(iter(prs)).new_slices == frozenset(["bar"])
+
+        # the PR was retargeted: the diff is fetched again
+        get.reset_mock()
+        json_response[0]["base"] = {**json_response[0]["base"], "ref": "ubuntu-24.04"}
+        diff_text = self.diff_text.replace("foo", "baz")
+        get.side_effect = self.make_side_effects(json_response, diff_text)
+        prs = forward_port_missing.fetch_prs(cache_dir=tmp_path, backend="diff")
+        assert get.call_count == 2
+        assert next(iter(prs)).new_slices == frozenset(["baz"])
+
+    @staticmethod
+    def make_files_side_effects(
+        json_response: list[dict], *pages: list[dict]
+    ) -> list[MagicMock]:
+        return [
+            MagicMock(json=MagicMock(return_value=json_response)),  # PR list response
+            *(MagicMock(ok=True, json=MagicMock(return_value=page)) for page in pages),
+        ]
+
+    @patch("forward_port_missing.requests.Session")
+    def test_files_backend(self, mock_session: MagicMock) -> None:
+        json_response = deepcopy(self.json_response)
+        json_response[0]["draft"] = False
+        files = [
+            {"filename": "slices/foo.yaml", "status": "added"},
+            {"filename": "slices/bar.yaml", "status": "modified"},
+            {"filename": "tests/spread/integration/baz/task.yaml", "status": "added"},
+        ]
+        get = _mock_session_get(mock_session)
+
+        get.side_effect = self.make_files_side_effects(json_response, files)
+        prs = forward_port_missing.fetch_prs()
+        assert next(iter(prs)).new_slices == frozenset(["foo"])
+        assert get.call_count == 2
+        assert get.call_args.args[0].endswith("/pulls/1/files")
+
+        # the files are paginated
+        get.reset_mock()
+        per_page = 100
+        padding = [{"filename": f"docs/{i}.md", "status": "added"} for i in range(per_page)]
+        get.side_effect = self.make_files_side_effects(json_response, padding, files)
+        prs = forward_port_missing.fetch_prs()
+        assert next(iter(prs)).new_slices == frozenset(["foo"])
+        assert get.call_count == 3
+
+    @patch("forward_port_missing.requests.Session")
+    def test_files_backend_fallback(self, mock_session: MagicMock) -> None:
+        json_response = deepcopy(self.json_response)
+        json_response[0]["draft"] = False
+        get = _mock_session_get(mock_session)
+
+        # the files cannot be listed: the diff is fetched instead
+        get.side_effect = [
+            MagicMock(json=MagicMock(return_value=json_response)),
+            MagicMock(ok=False),
+            MagicMock(text=self.diff_text),
+        ]
+        prs = forward_port_missing.fetch_prs()
+        assert next(iter(prs)).new_slices == frozenset(["foo"])
+        assert get.call_args.args[0] == "http://example.com/diff1"
+
+
+def _response(status_code: int, content: bytes = b"", **headers: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.encoding = "utf-8"
+    response.headers.update(headers)
+    return response
+
+
+class TestHttpCache:
+    def test_conditional_requests(self, tmp_path: Path) -> None:
+        cache = forward_port_missing.HttpCache(tmp_path)
+        session = MagicMock()
+        url = "https://api.github.com/repos/canonical/chisel-releases/pulls"
+        params = {"state": "open", "page": 1}
+
+        session.get.return_value = _response(200, b'["v1"]', ETag='"v1"')
+        assert cache.get(session, url, params=params).json() == ["v1"]
+        assert "If-None-Match" not in session.get.call_args.kwargs["headers"]
+
+        # unchanged: revalidated with the ETag
+        session.get.return_value = _response(304)
+        response = cache.get(session, url, params=params)
+        assert session.get.call_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+        assert response.status_code == 200
+        assert response.json() == ["v1"]
+
+        # within the TTL: no request at all
+        session.get.reset_mock()
+        assert cache.get(session, url, params=params, ttl=60).json() == ["v1"]
+        session.get.assert_not_called()
+
+        # changed
+        session.get.return_value = _response(200, b'["v2"]', ETag='"v2"')
+        assert cache.get(session, url, params=params).json() == ["v2"]
+        session.get.return_value = _response(304)
+        assert cache.get(session, url, params=params).json() == ["v2"]
+
+        # other parameters are cached separately
+        session.get.return_value = _response(200, b'["page 2"]', ETag='"p2"')
+        response = cache.get(session, url, params={**params, "page": 2})
+        assert response.json() == ["page 2"]
+
+        assert cache.counts == {"hits": 1, "revalidated": 2, "misses": 3}
+        assert "1 hits, 2 revalidated, 3 misses" in cache.summary()
+
+    def test_eviction(self, tmp_path: Path) -> None:
+        cache = forward_port_missing.HttpCache(tmp_path, max_bytes=1500)
+        session = MagicMock()
+        for i in range(3):
+            session.get.return_value = _response(200, b"x" * 500, ETag=f'"{i}"')
+            cache.get(session, f"https://example.com/{i}")
+            time.sleep(0.01)
+        assert len(list(tmp_path.glob("*.body"))) == 2
+        assert cache.counts["evicted"] == 1
+        # the least recently used response was evicted
+        session.get.return_value = _response(304)
+        session.get.reset_mock()
+        cache.get(session, "https://example.com/0", ttl=60)
+        session.get.assert_called_once()
+
+    def test_http_get_without_cache(self) -> None:
+        session = MagicMock()
+        forward_port_missing.http_get(session, "https://example.com", headers={"a": "b"})
+        session.get.assert_called_once_with(
+            "https://example.com", params=None, headers={"a": "b"}
+        )
+
+
 class TestFetchPackagesInRelease:
     @patch("forward_port_missing.requests.Session")
     def test_fetch_packages_in_release(self, mock_session_class):
@@ -133,6 +295,177 @@ class TestFetchPackagesInRelease:
         assert "ubuntu-22.04" in result
         assert "foo" in result["ubuntu-22.04"]
 
+    @patch("forward_port_missing.requests.Session")
+    def test_packages_cache(self, mock_session_class, tmp_path: Path) -> None:
+        get = _mock_session_get(mock_session_class)
+        index = b"Package: foo\nVersion: 1.0\nDescription: a long description\n\nPackage: bar\n"
+        get.return_value = _response(200, gzip.compress(index), ETag='"0"')
+
+        packages_cache = forward_port_missing.HttpCache(
+            tmp_path, transform=forward_port_missing._package_names_only
+        )
+        with patch("forward_port_missing._packages_cache", packages_cache):
+            result = forward_port_missing.fetch_packages_in_release({"ubuntu-22.04": "jammy"})
+            assert result["ubuntu-22.04"] == {"foo", "bar"}
+            # only the package names are kept
+            (body,) = {gzip.decompress(p.read_bytes()) for p in tmp_path.glob("*.body")}
+            assert body == b"Package: foo\nPackage: bar\n"
+
+            # the package lists are served from the cache on the next run
+            get.reset_mock()
+            packages_cache.counts.clear()
+            result = forward_port_missing.fetch_packages_in_release({"ubuntu-22.04": "jammy"})
+            assert result["ubuntu-22.04"] == {"foo", "bar"}
+            get.assert_not_called()
+            assert packages_cache.counts["hits"] == 16
+
+
+def _git(repo, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+def _chisel_yaml(suite: str, end_of_life: str) -> str:
+    return dedent(f"""
+    format: v1
+    archives:
+        ubuntu:
+            version: 1
+            suites: [{suite}, {suite}-security, {suite}-updates]
+    maintenance:
+        end-of-life: {end_of_life}
+    """)
+
+
+@pytest.fixture
+def chisel_releases(tmp_path: Path) -> Path:
+    """A local chisel-releases repository with a few release branches."""
+    repo = tmp_path / "chisel-releases"
+    repo.mkdir()
+    _git(repo, "init", "-q", "-b", "main")
+    (repo / "README.md").write_text("chisel-releases")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "-q", "-m", "main")
+    branches = {
+        "ubuntu-22.04": ("jammy", "2099-04-01", ["foo", "bar"]),
+        "ubuntu-24.04": ("noble", "2099-04-01", ["foo", "baz"]),
+        "ubuntu-20.04": ("focal", "2000-04-01", ["foo"]),  # end of life
+    }
+    for branch, (suite, eol, slices) in branches.items():
+        _git(repo, "checkout", "-q", "--orphan", branch)
+        _git(repo, "rm", "-rq", "--cached", ".")
+        for f in repo.iterdir():
+            if f.is_file():
+                f.unlink()
+        (repo / "chisel.yaml").write_text(_chisel_yaml(suite, eol))
+        (repo / "slices").mkdir(exist_ok=True)
+        for f in (repo / "slices").iterdir():
+            f.unlink()
+        for name in slices:
+            (repo / "slices" / f"{name}.yaml").write_text(f"package: {name}\n")
+        (repo / "slices" / "README.md").write_text("not a slice")
+        _git(repo, "add", ".")
+        _git(repo, "commit", "-q", "-m", branch)
+    # an ubuntu branch without chisel.yaml is skipped
+    _git(repo, "checkout", "-q", "--orphan", "ubuntu-99.04")
+    _git(repo, "rm", "-rq", "--cached", ".")
+    _git(repo, "clean", "-fdq")
+    _git(repo, "commit", "-q", "--allow-empty", "-m", "empty")
+    return repo
+
+
+class TestCheckoutChiselReleasesInfo:
+    def test_basic(self, chisel_releases: Path) -> None:
+        slices_per_branch, codenames = (
+            forward_port_missing.checkout_chisel_releases_info(
+                f"file://{chisel_releases}"
+            )
+        )
+        assert slices_per_branch == {
+            "ubuntu-22.04": {"foo", "bar"},
+            "ubuntu-24.04": {"foo", "baz"},
+        }
+        assert codenames == {"ubuntu-22.04": "jammy", "ubuntu-24.04": "noble"}
+
+    def test_cache_dir(self, chisel_releases: Path, tmp_path: Path) -> None:
+        bare = tmp_path / "bare.git"
+        _git(tmp_path, "clone", "-q", "--bare", str(chisel_releases), str(bare))
+        cache_dir = tmp_path / "cache"
+        url = f"file://{bare}"
+
+        slices_per_branch, _ = forward_port_missing.checkout_chisel_releases_info(
+            url, cache_dir
+        )
+        assert slices_per_branch["ubuntu-22.04"] == {"foo", "bar"}
+        assert (cache_dir / "chisel-releases.git").is_dir()
+        assert (cache_dir / "slices-snapshot.json").is_file()
+
+        # move the tip of one branch
+        _git(chisel_releases, "checkout", "-q", "ubuntu-22.04")
+        (chisel_releases / "slices" / "qux.yaml").write_text("package: qux\n")
+        (chisel_releases / "slices" / "foo.yaml").write_text("package: foo\n# v2\n")
+        _git(chisel_releases, "rm", "-q", "slices/bar.yaml")
+        _git(chisel_releases, "add", ".")
+        _git(chisel_releases, "commit", "-q", "-m", "update")
+        _git(chisel_releases, "push", "-q", str(bare), "ubuntu-22.04")
+
+        # the slices are not listed again, only updated from the diff
+        with patch(
+            "forward_port_missing._list_slices",
+            side_effect=AssertionError("listed"),
+        ):
+            slices_per_branch, codenames = (
+                forward_port_missing.checkout_chisel_releases_info(url, cache_dir)
+            )
+        assert slices_per_branch == {
+            "ubuntu-22.04": {"foo", "qux"},
+            "ubuntu-24.04": {"foo", "baz"},
+        }
+        assert codenames == {"ubuntu-22.04": "jammy", "ubuntu-24.04": "noble"}
+
+        # the snapshot is updated
+        slices_per_branch, _ = forward_port_missing.checkout_chisel_releases_info(
+            url, cache_dir
+        )
+        assert slices_per_branch["ubuntu-22.04"] == {"foo", "qux"}
+
+    def test_cache_dir_lost_tip(self, chisel_releases: Path, tmp_path: Path) -> None:
+        cache_dir = tmp_path / "cache"
+        url = f"file://{chisel_releases}"
+        forward_port_missing.checkout_chisel_releases_info(url, cache_dir)
+        snapshot_path = cache_dir / "slices-snapshot.json"
+        snapshot = json.loads(snapshot_path.read_text())
+        snapshot["ubuntu-22.04"]["tip"] = "0" * 40
+        snapshot_path.write_text(json.dumps(snapshot))
+
+        # the slices of a branch whose previous tip is unknown are listed again
+        slices_per_branch, _ = forward_port_missing.checkout_chisel_releases_info(
+            url, cache_dir
+        )
+        assert slices_per_branch["ubuntu-22.04"] == {"foo", "bar"}
+
+
+    def test_blobless_clone(self, chisel_releases: Path, tmp_path: Path) -> None:
+        _git(chisel_releases, "config", "uploadpack.allowFilter", "true")
+        _git(chisel_releases, "config", "uploadpack.allowAnySHA1InWant", "true")
+        cache_dir = tmp_path / "cache"
+        url = f"file://{chisel_releases}"
+        _, codenames = forward_port_missing.checkout_chisel_releases_info(url, cache_dir)
+        assert codenames == {"ubuntu-22.04": "jammy", "ubuntu-24.04": "noble"}
+
+        # the chisel.yaml blobs are fetched together, after the clone
+        packs = cache_dir / "chisel-releases.git" / "objects" / "pack"
+        assert len(list(packs.glob("*.promisor"))) == 2
+
+        # and not fetched again on the next call
+        with patch("forward_port_missing._git", wraps=forward_port_missing._git) as git:
+            forward_port_missing.checkout_chisel_releases_info(url, cache_dir)
+        assert not [c for c in git.call_args_list if "origin" in c.args]
+
 
 class TestDetermineForwardPortingStatus:
     pr: forward_port_missing.PR = forward_port_missing.PR(
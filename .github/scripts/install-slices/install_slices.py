@@ -5,42 +5,157 @@ Verify chisel slice definition files by installing the slices.
 
 Usage
 -----
-install_slices [-h] --arch ARCH --release RELEASE [--dry-run]
-               [--ensure-existence] [--ignore-missing] [file ...]
+install_slices [-h] --arch ARCH [--release RELEASE]
+               [--release-dir RELEASE_DIR] [--files0-from FILES0_FROM]
+               [--dry-run] [--ensure-existence] [--ignore-missing]
+               [--chisel-version CHISEL_VERSION] [--workers WORKERS]
+               [--cache-dir CACHE_DIR] [--reduce-essentials]
+               [--history-db HISTORY_DB]
+               [--existence-backend {index,rmadison}]
+               [--archive-mirror ARCHIVE_MIRROR]
+               [--existence-index EXISTENCE_INDEX]
+               [--results-cache RESULTS_CACHE] [--batch-size BATCH_SIZE]
+               [--package-affinity] [--report-jsonl REPORT_JSONL]
+               [--report-junit REPORT_JUNIT] [--max-failures MAX_FAILURES]
+               [--scratch-dir SCRATCH_DIR]
+               [--scratch-max-size SCRATCH_MAX_SIZE] [file ...]
 
 positional arguments:
   file                Chisel slice definition file(s)
 
 options:
   -h, --help          show this help message and exit
-  --arch ARCH         Package architecture
-  --release RELEASE   chisel-releases branch name or directory
+  --arch ARCH         Package architecture(s), comma-separated (e.g. amd64,arm64)
+  --release RELEASE   chisel-releases branch name or directory. Can be repeated
+                      to install the slices of several releases, in which case
+                      each file is installed for the release directory
+                      containing it, so the releases must be directories if
+                      files are given
+  --release-dir RELEASE_DIR
+                      chisel-releases directory whose slice definition files
+                      under slices/ are all installed. Can be repeated
+  --files0-from FILES0_FROM
+                      Read the slice definition files from FILES0_FROM, as
+                      NUL-separated paths ("-" for stdin)
   --dry-run           Perform dry run: do not actually install the slices
   --ensure-existence  Each package must exist in the archive for at least one architecture
   --ignore-missing    Ignore arch-specific package not found in archive errors
+  --chisel-version CHISEL_VERSION
+                      Version of chisel being used (default: unknown)
+  --workers WORKERS   Number of workers to use for parallel installation (default: 5)
+  --cache-dir CACHE_DIR
+                      Chisel download cache shared by all the workers (default: a
+                      temporary directory, removed at exit)
+  --reduce-essentials Only cut the slices which are not installed as essentials
+                      of other slices, and verify from the chisel manifest
+                      that all the slices were installed, directly or
+                      indirectly. The release must define base-files_chisel
+  --history-db HISTORY_DB
+                      SQLite database of past cut durations, used to start the
+                      longest cuts first (default: none)
+  --existence-backend {index,rmadison}
+                      How to query the existence of packages in the archive:
+                      from the archive's Packages indices, or with rmadison
+                      (default: index)
+  --archive-mirror ARCHIVE_MIRROR
+                      URL or local directory of the archive mirror to read the
+                      Packages indices from (default: the Ubuntu archive)
+  --existence-index EXISTENCE_INDEX
+                      JSON file to read the package existence index from, if it
+                      exists and matches the release archive, or to save it to
+                      otherwise. With several releases, the index of the N-th
+                      release is EXISTENCE_INDEX-N.json (default: none)
+  --results-cache RESULTS_CACHE
+                      SQLite database of the successful cuts. Cuts whose slice
+                      definitions, essentials, chisel version, arch,
+                      chisel.yaml and packages in the archive did not change
+                      since they last succeeded are skipped (default: none)
+  --batch-size BATCH_SIZE
+                      Number of slices to install with a single "chisel cut".
+                      Failing batches are bisected to find the failing slices
+                      (default: 1)
+  --package-affinity  Install all the slices of a package one after the other
+                      on the same worker, to reuse its warm cache. Packages
+                      with more slices than a fair share of the workers are
+                      split (default: false)
+  --report-jsonl REPORT_JSONL
+                      Path of a JSON Lines report with one record per slice,
+                      written as the cuts complete (default: none)
+  --report-junit REPORT_JUNIT
+                      Path of a JUnit XML report with one test case per slice
+                      (default: none)
+  --max-failures MAX_FAILURES
+                      Stop installing slices once this many cuts failed
+                      (default: none, install all the slices)
+  --scratch-dir SCRATCH_DIR
+                      Directory where each worker keeps the root it cuts
+                      slices into, emptied and reused between cuts (default:
+                      /dev/shm if writable, else the temporary directory)
+  --scratch-max-size SCRATCH_MAX_SIZE
+                      Size in MiB above which the roots of a package are cut
+                      into a temporary directory on disk instead, also used
+                      when the scratch directory is short of space
+                      (default: 512)
 """
 
 import argparse
+import fcntl
+import gzip
+import hashlib
+import io
+import json
 import logging
+import logging.handlers
+import lzma
 import math
+import multiprocessing
+import multiprocessing.queues
 import os
 import pathlib
+import random
+import re
+import resource
+import shutil
+import sqlite3
+import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import time
+import xml.etree.ElementTree as ET
 
-import magic
 import requests
 import yaml
 
-from apt.debfile import DebPackage
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Callable, Iterator
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Use the libyaml based loader when PyYAML was built with it.
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 CHISEL_PKG_CACHE = pathlib.Path.home() / ".cache/chisel/sha256"
 
+# Path of the manifest generated by the "base-files_chisel" slice.
+CHISEL_MANIFEST = "var/lib/chisel/manifest.wall"
+CHISEL_MANIFEST_SLICE = ("base-files", "chisel")
+
+# Architectures supported by chisel.
+ARCHIVE_ARCHES = ["amd64", "arm64", "armhf", "i386", "ppc64el", "riscv64", "s390x"]
+
+# Default archive mirrors, as used by chisel. Only amd64 and i386 are
+# published in the main archive, the other arches are in the ports archive.
+UBUNTU_ARCHIVE_URL = "http://archive.ubuntu.com/ubuntu"
+UBUNTU_PORTS_URL = "http://ports.ubuntu.com/ubuntu-ports"
+
 
 class MissingCopyright(Exception):
     pass
@@ -67,6 +182,54 @@ def configure_logging() -> None:
     logging.basicConfig(level=logging.INFO, handlers=[console_handler, file_handler])
 
 
+# Queue of the log records of the worker processes, set by log_listener().
+_log_queue: multiprocessing.queues.Queue | None = None
+
+
+@contextmanager
+def log_listener() -> Iterator[None]:
+    """
+    Handle the log records of the worker processes started by worker_pool()
+    in a single listener thread of this process, with the handlers of the
+    root logger. This keeps the workers from writing to the console and to
+    error.log concurrently, which interleaves and tears their lines.
+    """
+    global _log_queue
+    queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(
+        queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    listener.start()
+    _log_queue = queue
+    try:
+        yield
+    finally:
+        _log_queue = None
+        listener.stop()
+
+
+def _init_worker_logging(queue: multiprocessing.queues.Queue | None) -> None:
+    """
+    Send the log records of a worker process to the queue of log_listener().
+    """
+    if queue is None:
+        return
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(queue)]
+    root.setLevel(logging.INFO)
+
+
+def worker_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Return a pool of worker processes logging through log_listener().
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker_logging,
+        initargs=(_log_queue,),
+    )
+
+
 def parse_args() -> argparse.Namespace:
     """
     Parse CLI args passed to this script.
@@ -77,12 +240,32 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--arch",
         required=True,
-        help="Package architecture",
+        help="Package architecture(s), comma-separated (e.g. amd64,arm64)",
     )
     parser.add_argument(
         "--release",
-        required=True,
-        help="chisel-releases branch name or directory",
+        required=False,
+        default=[],
+        action="append",
+        help="chisel-releases branch name or directory. Can be repeated to "
+        "install the slices of several releases, in which case each file is "
+        "installed for the release directory containing it, so the releases "
+        "must be directories if files are given",
+    )
+    parser.add_argument(
+        "--release-dir",
+        required=False,
+        default=[],
+        action="append",
+        help="chisel-releases directory whose slice definition files under "
+        "slices/ are all installed. Can be repeated",
+    )
+    parser.add_argument(
+        "--files0-from",
+        required=False,
+        default=None,
+        help="Read the slice definition files from FILES0_FROM, as "
+        'NUL-separated paths ("-" for stdin)',
     )
     parser.add_argument(
         "--dry-run",
@@ -121,18 +304,147 @@ def parse_args() -> argparse.Namespace:
         type=int,
         help="Number of workers to use for parallel installation (default: 5)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        default=None,
+        help="Chisel download cache shared by all the workers "
+        "(default: a temporary directory, removed at exit)",
+    )
+    parser.add_argument(
+        "--reduce-essentials",
+        required=False,
+        action="store_true",
+        help="Only cut the slices which are not installed as essentials of "
+        "other slices, and verify from the chisel manifest that all the "
+        "slices were installed, directly or indirectly. The release must "
+        "define base-files_chisel",
+    )
+    parser.add_argument(
+        "--history-db",
+        required=False,
+        default=None,
+        help="SQLite database of past cut durations, used to start the "
+        "longest cuts first (default: none)",
+    )
+    parser.add_argument(
+        "--existence-backend",
+        required=False,
+        default="index",
+        choices=["index", "rmadison"],
+        help="How to query the existence of packages in the archive: from the "
+        "archive's Packages indices, or with rmadison (default: index)",
+    )
+    parser.add_argument(
+        "--archive-mirror",
+        required=False,
+        default=None,
+        help="URL or local directory of the archive mirror to read the Packages "
+        "indices from (default: the Ubuntu archive)",
+    )
+    parser.add_argument(
+        "--existence-index",
+        required=False,
+        default=None,
+        help="JSON file to read the package existence index from, if it exists "
+        "and matches the release archive, or to save it to otherwise. With "
+        "several releases, the index of the N-th release is FILE-N.json "
+        "(default: none)",
+    )
+    parser.add_argument(
+        "--results-cache",
+        required=False,
+        default=None,
+        help="SQLite database of the successful cuts. Cuts whose slice "
+        "definitions, essentials, chisel version, arch, chisel.yaml and "
+        "packages in the archive did not change since they last succeeded "
+        "are skipped (default: none)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        default=1,
+        type=int,
+        help='Number of slices to install with a single "chisel cut". Failing '
+        "batches are bisected to find the failing slices (default: 1)",
+    )
+    parser.add_argument(
+        "--package-affinity",
+        required=False,
+        action="store_true",
+        default=False,
+        help="Install all the slices of a package one after the other on the "
+        "same worker, to reuse its warm cache. Packages with more slices than "
+        "a fair share of the workers are split (default: false)",
+    )
+    parser.add_argument(
+        "--report-jsonl",
+        required=False,
+        default=None,
+        help="Path of a JSON Lines report with one record per slice, written "
+        "as the cuts complete (default: none)",
+    )
+    parser.add_argument(
+        "--report-junit",
+        required=False,
+        default=None,
+        help="Path of a JUnit XML report with one test case per slice "
+        "(default: none)",
+    )
+    parser.add_argument(
+        "--max-failures",
+        required=False,
+        default=None,
+        type=int,
+        help="Stop installing slices once this many cuts failed "
+        "(default: none, install all the slices)",
+    )
+    parser.add_argument(
+        "--scratch-dir",
+        required=False,
+        default=None,
+        help="Directory where each worker keeps the root it cuts slices into, "
+        "emptied and reused between cuts (default: /dev/shm if writable, else "
+        "the temporary directory)",
+    )
+    parser.add_argument(
+        "--scratch-max-size",
+        required=False,
+        default=512,
+        type=int,
+        help="Size in MiB above which the roots of a package are cut into a "
+        "temporary directory on disk instead, also used when the scratch "
+        "directory is short of space (default: 512)",
+    )
+    args = parser.parse_args()
+    if not args.release and not args.release_dir:
+        parser.error("one of the arguments --release --release-dir is required")
+    if (
+        len(args.release) + len(args.release_dir) > 1
+        and (args.files or args.files0_from)
+        and not all(os.path.isdir(r) for r in args.release)
+    ):
+        # The files could not be told apart between the branches.
+        parser.error(
+            "argument --release: must be a directory when files are given with "
+            "several releases"
+        )
+    if args.max_failures is not None and args.max_failures < 1:
+        parser.error("argument --max-failures: must be at least 1")
+    return args
 
 
 @dataclass
 class Archive:
     """
     Minimal data class replicating ubuntu archive in chisel.yaml.
+    The digest is the sha256 of the chisel.yaml file.
     """
 
     version: str
     components: list[str]
     suites: list[str]
+    digest: str = field(default="", compare=False)
 
 
 def parse_archive(release: str) -> Archive:
@@ -153,14 +465,15 @@ def parse_archive(release: str) -> Archive:
     try:
         if "/" in release:
             filepath = os.path.join(release, "chisel.yaml")
-            with open(filepath, "r", encoding="utf-8") as stream:
-                data = yaml.safe_load(stream)
+            with open(filepath, "rb") as stream:
+                content = stream.read()
         else:
             base_url = "https://raw.githubusercontent.com/canonical/chisel-releases"
             req_url = f"{base_url}/{release}/chisel.yaml"
             response = requests.get(req_url, timeout=30)
             response.raise_for_status()
-            data = yaml.safe_load(response.content)
+            content = response.content
+        data = yaml.load(content, Loader=YamlLoader)
     except yaml.YAMLError as e:
         logging.error("chisel.yaml: %s", e)
         sys.exit(1)
@@ -169,7 +482,12 @@ def parse_archive(release: str) -> Archive:
     version = archive_data["version"]
     if isinstance(version, float):
         version = f"{version:.2f}"
-    archive = Archive(str(version), archive_data["components"], archive_data["suites"])
+    archive = Archive(
+        str(version),
+        archive_data["components"],
+        archive_data["suites"],
+        hashlib.sha256(content).hexdigest(),
+    )
     return archive
 
 
@@ -177,10 +495,17 @@ def parse_archive(release: str) -> Archive:
 class Package:
     """
     Minimal data class to store package info.
+    The essentials map each slice name to its essential slices, which in
+    turn map to the arches they apply to (all arches if empty). The digest
+    is the sha256 of the slice definition file.
     """
 
     package: str
     slices: list[str]
+    essentials: dict[str, dict[str, list[str]]] = field(
+        default_factory=dict, compare=False
+    )
+    digest: str = field(default="", compare=False)
 
 
 def full_slice_name(pkg: str, slice: str) -> str:
@@ -190,14 +515,37 @@ def full_slice_name(pkg: str, slice: str) -> str:
     return f"{pkg}_{slice}"
 
 
+def _parse_essentials(essential: list | dict | None) -> dict[str, list[str]]:
+    """
+    Parse an "essential" field of a slice definition file, returning a map
+    of essential slice name to the arches it applies to (all if empty).
+    The field is either a list of slice names, or a map of slice names to
+    their options:
+        essential:
+            libc6_libs: {arch: [amd64, arm64]}
+    """
+    if not essential:
+        return {}
+    if isinstance(essential, list):
+        return {name: [] for name in essential}
+    essentials = {}
+    for name, options in essential.items():
+        arch = (options or {}).get("arch", [])
+        if isinstance(arch, str):
+            arch = [arch]
+        essentials[name] = list(arch)
+    return essentials
+
+
 def parse_package(filepath: str) -> Package:
     """
     Parse a slice definition file and return the Package.
     """
     logging.debug("Parsing %s...", filepath)
-    with open(filepath, "r", encoding="utf-8") as stream:
+    with open(filepath, "rb") as stream:
+        content = stream.read()
         try:
-            data = yaml.safe_load(stream)
+            data = yaml.load(content, Loader=YamlLoader)
         except yaml.YAMLError as e:
             logging.error("%s: %s", filepath, e)
             sys.exit(1)
@@ -208,10 +556,360 @@ def parse_package(filepath: str) -> Package:
     except KeyError as e:
         logging.error("%s: key %s not found", filepath, e)
         sys.exit(1)
-    pkg = Package(package, slices)
+    # The package-level essentials apply to every slice, except themselves.
+    pkg_essentials = _parse_essentials(data.get("essential"))
+    essentials = {}
+    for slice, slice_data in data["slices"].items():
+        slice_essentials = dict(pkg_essentials)
+        slice_essentials.update(_parse_essentials((slice_data or {}).get("essential")))
+        slice_essentials.pop(full_slice_name(package, slice), None)
+        essentials[slice] = slice_essentials
+    pkg = Package(package, slices, essentials, hashlib.sha256(content).hexdigest())
     return pkg
 
 
+def parse_packages(files: list[str], workers: int = 1) -> list[Package]:
+    """
+    Parse the slice definition files, in parallel with up to workers
+    processes, and return the Packages in the same order.
+    """
+    if workers <= 1 or len(files) < 2 * workers:
+        return [parse_package(f) for f in files]
+    chunksize = max(1, len(files) // (workers * 4))
+    with worker_pool(workers) as executor:
+        return list(executor.map(parse_package, files, chunksize=chunksize))
+
+
+def find_slice_definitions(release: str) -> list[str]:
+    """
+    Return the slice definition files of a release directory, which are
+    under its slices/ directory. Return an empty list if the release is not
+    a local directory.
+    """
+    slices_dir = pathlib.Path(release) / "slices"
+    if not slices_dir.is_dir():
+        return []
+    return [str(f) for f in sorted(slices_dir.rglob("*.yaml"))]
+
+
+def read_files0(path: str) -> list[str]:
+    """
+    Read a list of NUL-separated paths from the file at path, or from the
+    standard input if path is "-".
+    """
+    if path == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    return [os.fsdecode(p) for p in data.split(b"\0") if p]
+
+
+def parse_release_packages(
+    release: str, workers: int = 1, known: dict[str, Package] | None = None
+) -> list[Package]:
+    """
+    Parse all the slice definition files of a release directory. Return an
+    empty list if the release is not a local directory.
+    known maps the real paths of slice definition files which were already
+    parsed to their Package, which is reused instead of parsing them again.
+    """
+    known = known or {}
+    files = find_slice_definitions(release)
+    paths = [os.path.realpath(f) for f in files]
+    missing = [f for f, path in zip(files, paths) if path not in known]
+    parsed = dict(zip(missing, parse_packages(missing, workers)))
+    return [
+        known[path] if path in known else parsed[f] for f, path in zip(files, paths)
+    ]
+
+
+def find_manifest_slice(release: str, packages: list[Package]) -> str:
+    """
+    Return the full name of the slice generating the chisel manifest (see
+    CHISEL_MANIFEST_SLICE) if the release defines it, or an empty string.
+    The slice is looked up in packages first, and then in the slice
+    definition file of its package in the release directory.
+    """
+    pkg_name, slice = CHISEL_MANIFEST_SLICE
+    pkg = next((p for p in packages if p.package == pkg_name), None)
+    if pkg is None:
+        path = pathlib.Path(release) / "slices" / f"{pkg_name}.yaml"
+        if path.is_file():
+            pkg = parse_package(str(path))
+    if pkg is None or slice not in pkg.slices:
+        return ""
+    return full_slice_name(pkg_name, slice)
+
+
+def essentials_graph(packages: list[Package], arch: str) -> dict[str, set[str]]:
+    """
+    Return the map of full slice name to the full names of its direct
+    essentials on arch.
+    """
+    graph = {}
+    for pkg in packages:
+        for slice, essentials in pkg.essentials.items():
+            graph[full_slice_name(pkg.package, slice)] = {
+                name
+                for name, arches in essentials.items()
+                if not arches or arch in arches
+            }
+    return graph
+
+
+def essentials_closure(graph: dict[str, set[str]], slice_name: str) -> set[str]:
+    """
+    Return the slices installed when cutting slice_name, i.e. slice_name
+    and its transitive essentials.
+    """
+    closure = {slice_name}
+    stack = [slice_name]
+    while stack:
+        for essential in graph.get(stack.pop(), ()):
+            if essential not in closure:
+                closure.add(essential)
+                stack.append(essential)
+    return closure
+
+
+def reduce_slices(
+    all_slices: list[tuple[str, str]], graph: dict[str, set[str]]
+) -> dict[tuple[str, str], set[str]]:
+    """
+    Pick a minimal set of "root" slices whose cuts install all the slices in
+    all_slices, directly or as (transitive) essentials.
+    Return the map of root slice to the slices of all_slices it installs.
+    """
+    requested = {full_slice_name(pkg, slice): (pkg, slice) for pkg, slice in all_slices}
+    closures = {
+        name: essentials_closure(graph, name) & requested.keys() for name in requested
+    }
+    # If a slice is an essential of another, the closure of the former is a
+    # subset of the latter's. Visiting the slices with larger closures first
+    # thus only picks slices which are not an essential of any other (or one
+    # slice per cycle of essentials).
+    roots = {}
+    covered: set[str] = set()
+    for name in sorted(requested, key=lambda n: (-len(closures[n]), n)):
+        if name in covered:
+            continue
+        roots[requested[name]] = closures[name]
+        covered |= closures[name]
+    return {s: roots[s] for s in all_slices if s in roots}
+
+
+@dataclass
+class PackageIndex:
+    """
+    Map of package name to the arches it is available for in an archive,
+    among the arches the index was built for. versions maps each of these
+    arches to the digests of the Packages entries of each package, which
+    change with any new version of the package in any suite.
+    """
+
+    archive: Archive
+    arches: dict[str, set[str]] = field(default_factory=dict)
+    indexed_arches: list[str] = field(default_factory=lambda: list(ARCHIVE_ARCHES))
+    versions: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    def query(
+        self, packages: list[str], arch: list[str] | None = None
+    ) -> tuple[list[str], list[str]]:
+        """
+        Return the packages that exist for any of the arches (or for any arch
+        at all if not specified), and the packages which do not.
+        """
+        found, missing = [], []
+        for pkg in set(packages):
+            pkg_arches = self.arches.get(pkg, set())
+            if pkg_arches and (not arch or not pkg_arches.isdisjoint(arch)):
+                found.append(pkg)
+            else:
+                missing.append(pkg)
+        return sorted(found), sorted(missing)
+
+    def save(self, path: str) -> None:
+        """
+        Save the index as JSON, so that other jobs can reuse it.
+        """
+        data = {
+            "archive": {
+                "version": self.archive.version,
+                "components": self.archive.components,
+                "suites": self.archive.suites,
+            },
+            "arches": {pkg: sorted(arches) for pkg, arches in self.arches.items()},
+            "indexed_arches": self.indexed_arches,
+            "versions": self.versions,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str) -> "PackageIndex":
+        """
+        Load an index saved with PackageIndex.save().
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            Archive(**data["archive"]),
+            {pkg: set(arches) for pkg, arches in data["arches"].items()},
+            # Indices saved without these are rebuilt.
+            data.get("indexed_arches", []),
+            data.get("versions", {}),
+        )
+
+
+# Precompiled regexes to extract the package names and the digests of the
+# debs from the Packages indices.
+_PACKAGE_RE = re.compile(rb"^Package:\s*(\S+)", re.MULTILINE)
+_SHA256_RE = re.compile(rb"^SHA256:\s*(\S+)", re.MULTILINE)
+
+
+def _archive_base_url(arch: str, mirror: str | None = None) -> str:
+    """
+    Return the base URL of the archive mirror for arch.
+    """
+    if mirror:
+        return mirror.rstrip("/")
+    if arch in ("amd64", "i386"):
+        return UBUNTU_ARCHIVE_URL
+    return UBUNTU_PORTS_URL
+
+
+def _read_packages_file(
+    mirror: str | None, suite: str, component: str, arch: str
+) -> bytes | None:
+    """
+    Read the Packages index for (suite, component, arch) from a local mirror
+    directory or download it from a remote mirror. Return the decompressed
+    index, or None if the archive does not provide it.
+    """
+    index_path = f"dists/{suite}/{component}/binary-{arch}/Packages"
+    if mirror and os.path.isdir(mirror):
+        for ext, decompress in (
+            ("", bytes),
+            (".gz", gzip.decompress),
+            (".xz", lzma.decompress),
+        ):
+            path = os.path.join(mirror, index_path + ext)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    return decompress(f.read())
+        return None
+    base_url = _archive_base_url(arch, mirror)
+    response = requests.get(f"{base_url}/{index_path}.gz", timeout=60)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return gzip.decompress(response.content)
+
+
+def build_package_index(
+    archive: Archive,
+    arches: list[str] | None = None,
+    mirror: str | None = None,
+) -> PackageIndex:
+    """
+    Build the PackageIndex of the archive for the given arches (all the
+    arches supported by chisel if not specified) from the Packages indices
+    of the archive's suites and components. The indices are read from
+    mirror, which is either a URL or a local directory with the same layout
+    as the archive (dists/<suite>/<component>/binary-<arch>/Packages[.gz|.xz]).
+    """
+    arches = arches or ARCHIVE_ARCHES
+    indices = [
+        (suite, component, arch)
+        for suite in archive.suites
+        for component in archive.components
+        for arch in arches
+    ]
+    logging.info(
+        "Reading %d Packages indices of ubuntu-%s...", len(indices), archive.version
+    )
+
+    def _read(args: tuple[str, str, str]) -> list[tuple[str, bytes]] | None:
+        # Only the package names and the sha256 of their debs are kept, so
+        # that no more than one Packages index per thread is held in memory.
+        content = _read_packages_file(mirror, *args)
+        if content is None:
+            return None
+        stanzas = []
+        for stanza in content.split(b"\n\n"):
+            m = _PACKAGE_RE.search(stanza)
+            if m is None:
+                continue
+            sha256 = _SHA256_RE.search(stanza)
+            stanzas.append((m.group(1).decode(), sha256.group(1) if sha256 else b""))
+        return stanzas
+
+    index = PackageIndex(archive, indexed_arches=list(arches))
+    entries: dict[str, dict[str, list[bytes]]] = {arch: {} for arch in arches}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {executor.submit(_read, args): args for args in indices}
+        try:
+            for future in as_completed(futures):
+                suite, component, arch = futures[future]
+                stanzas = future.result()
+                if stanzas is None:
+                    logging.debug(
+                        "No Packages index for %s/%s/%s", suite, component, arch
+                    )
+                    continue
+                for pkg, sha256 in stanzas:
+                    index.arches.setdefault(pkg, set()).add(arch)
+                    entries[arch].setdefault(pkg, []).append(
+                        suite.encode() + b":" + sha256
+                    )
+        except BaseException:
+            # Do not read the remaining indices once one could not be read.
+            executor.shutdown(cancel_futures=True)
+            raise
+    index.versions = {
+        arch: {
+            pkg: hashlib.sha256(b"\n".join(sorted(e))).hexdigest()[:16]
+            for pkg, e in pkgs.items()
+        }
+        for arch, pkgs in entries.items()
+    }
+    return index
+
+
+def load_or_build_package_index(
+    archive: Archive,
+    backend: str = "index",
+    mirror: str | None = None,
+    path: str | None = None,
+    arches: list[str] | None = None,
+) -> PackageIndex | None:
+    """
+    Return the PackageIndex of the archive for the given arches (all the
+    arches supported by chisel if not specified). Load it from path if it
+    was saved there for the same archive and at least these arches,
+    otherwise build it and save it to path. Return None for backends which
+    do not use an index.
+    """
+    arches = arches or ARCHIVE_ARCHES
+    if path and os.path.isfile(path):
+        index = PackageIndex.load(path)
+        if index.archive == archive and set(arches) <= set(index.indexed_arches):
+            logging.info("Loaded package existence index from %s", path)
+            return index
+        logging.warning(
+            "Ignoring package existence index for %s (%s)",
+            index.archive,
+            ",".join(index.indexed_arches),
+        )
+    if backend != "index":
+        return None
+    index = build_package_index(archive, arches, mirror=mirror)
+    if path:
+        index.save(path)
+    return index
+
+
 def _query_package_existence(
     packages: list[str],
     archive: Archive,
@@ -258,14 +956,24 @@ def query_package_existence(
     archive: Archive,
     arch: list[str] | None = None,
     batch_size: int = 50,
+    backend: str = "index",
+    mirror: str | None = None,
+    index: PackageIndex | None = None,
 ) -> tuple[list[str], list[str]]:
     """
     Check which packages exist in the archive. Return a list of packages
     that exist and another list for which do not.
-    This function breaks down the package list into batches, to avoid
-    URI length limits.
+    If an index of the archive is given, it is used regardless of the
+    backend. Otherwise, the "index" backend reads the Packages indices of
+    the archive (from mirror, if specified) and answers for all the
+    packages at once. The "rmadison" backend breaks down the package list
+    into batches, to avoid URI length limits.
     """
     logging.info("Querying packages in %s", archive)
+    if index is None and backend == "index":
+        index = build_package_index(archive, arch, mirror)
+    if index is not None:
+        return index.query(packages, arch)
     n_batches = math.ceil(len(packages) / batch_size)
     found, missing = set(), set()
     for i in range(n_batches):
@@ -276,12 +984,20 @@ def query_package_existence(
         missing.update(m)
     return sorted(found), sorted(missing)
 
-def ensure_package_existence(packages: list[str], archive: Archive) -> None:
+def ensure_package_existence(
+    packages: list[str],
+    archive: Archive,
+    backend: str = "index",
+    mirror: str | None = None,
+    index: PackageIndex | None = None,
+) -> None:
     """
     Ensure that packages exist in the archive for any arch.
     """
     logging.info("Ensuring packages existence in ubuntu-%s archive...", archive.version)
-    _, missing = query_package_existence(packages, archive)
+    _, missing = query_package_existence(
+        packages, archive, backend=backend, mirror=mirror, index=index
+    )
     if len(missing) > 0:
         logging.error(
             "The following packages do not exist for ubuntu-%s:\n%s",
@@ -295,13 +1011,25 @@ def ignore_missing_packages(
     packages: list[Package],
     arch: str,
     release: str,
+    backend: str = "index",
+    mirror: str | None = None,
+    index: PackageIndex | None = None,
 ) -> tuple[list[Package], list[Package]]:
     """
     Filter the packages that do not exist in the archive for [arch, release].
+    If given, the index of the release archive is used to avoid querying
+    the archive again.
     """
     package_names = [p.package for p in packages]
-    archive = parse_archive(release)
-    found, _ = query_package_existence(package_names, archive, arch=[arch])
+    archive = index.archive if index is not None else parse_archive(release)
+    found, _ = query_package_existence(
+        package_names,
+        archive,
+        arch=[arch],
+        backend=backend,
+        mirror=mirror,
+        index=index,
+    )
     #
     logging.info("Ignoring missing packages in ubuntu-%s/%s...", archive.version, arch)
     filtered = []
@@ -322,105 +1050,1367 @@ _patterns_to_retry: list[str] = [
     "cannot find archive data",
 ]
 
+
+def match_archive_error(err: str) -> str | None:
+    """
+    Return the first of the _patterns_to_retry matched by the error of a
+    cut, if any, i.e. whether the cut failed to reach the archive.
+    """
+    for pattern in _patterns_to_retry:
+        if pattern in err:
+            return pattern
+    return None
+
+
+@dataclass
+class CutResult:
+    """
+    Outcome of a "chisel cut" of a slice. duration is the wall-clock time of
+    the cut, and user_time and sys_time the CPU time of chisel, all in
+    seconds and including the retries. peak_rss is the peak resident set size
+    of chisel, cache_bytes the size of the debs installed by the cut which
+    it added to the chisel cache and root_bytes the size of the installed
+    root, in bytes.
+    retry_pattern is the last of the _patterns_to_retry matched by an error
+    of the cut, if any. copyright_missing lists the packages whose copyright
+    file was not installed by the cut.
+    """
+
+    slice_name: str
+    error: str | None
+    attempts: int
+    duration: float
+    user_time: float = 0.0
+    sys_time: float = 0.0
+    peak_rss: int = 0
+    cache_bytes: int = 0
+    root_bytes: int = 0
+    retry_pattern: str | None = None
+    copyright_missing: list[str] = field(default_factory=list)
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.sys_time
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and not self.copyright_missing
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "failed"
+        if self.copyright_missing:
+            return "copyright-missing"
+        return "passed"
+
+
+# Exponential backoff between the attempts of a cut, in seconds.
+RETRY_BACKOFF_BASE = 2.0
+RETRY_BACKOFF_CAP = 60.0
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Return how long to wait before retrying a cut after its attempt-th
+    attempt failed: a random delay up to an exponentially growing cap, so
+    that the workers which failed together do not retry together.
+    """
+    cap = min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, cap)
+
+
+class ArchiveBreaker:
+    """
+    Circuit breaker shared by all the workers through a state file, which
+    pauses the cuts when many of them fail to reach the archive.
+
+    The breaker opens when threshold archive errors are recorded within
+    window seconds, and the workers wait before starting their next cut.
+    Once the cooldown expires, a single worker probes the archive with its
+    cut while the others keep waiting. If the probe reaches the archive the
+    breaker closes, otherwise it opens again for twice as long, up to
+    max_cooldown seconds.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        threshold: int = 5,
+        window: float = 30.0,
+        cooldown: float = 15.0,
+        max_cooldown: float = 240.0,
+        probe_timeout: float = 120.0,
+    ) -> None:
+        self.path = path
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+
+    def _closed_state(self) -> dict:
+        return {
+            "failures": [],
+            "open_until": 0.0,
+            "cooldown": self.cooldown,
+            "probe_until": 0.0,
+        }
+
+    @contextmanager
+    def _state(self) -> Iterator[dict]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            data = f.read()
+            state = json.loads(data) if data else self._closed_state()
+            yield state
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+
+    def wait(self) -> bool:
+        """
+        Block while the breaker is open. Return whether the caller is the
+        worker which probes the archive.
+        """
+        logged = False
+        while True:
+            with self._state() as state:
+                now = time.time()
+                if not state["open_until"]:
+                    return False
+                if now < state["open_until"]:
+                    delay = state["open_until"] - now
+                elif now >= state["probe_until"]:
+                    state["probe_until"] = now + self.probe_timeout
+                    return True
+                else:
+                    delay = min(1.0, state["probe_until"] - now)
+            if not logged:
+                logging.info("Archive circuit breaker is open, waiting...")
+                logged = True
+            time.sleep(delay)
+
+    def record(self, archive_error: bool) -> None:
+        """
+        Record the outcome of a cut: whether it failed to reach the archive.
+        """
+        with self._state() as state:
+            now = time.time()
+            if not archive_error:
+                # Old errors expire with the window while the breaker is
+                # closed, so only a cut reaching the archive while it is
+                # open closes it.
+                if state["open_until"]:
+                    logging.info("Archive circuit breaker closed.")
+                    state.update(self._closed_state())
+                return
+            if state["open_until"]:
+                if now >= state["open_until"]:
+                    # The probe failed, so open the breaker for longer.
+                    cooldown = min(state["cooldown"] * 2, self.max_cooldown)
+                    state["cooldown"] = cooldown
+                    state["open_until"] = now + cooldown
+                    state["probe_until"] = 0.0
+                    logging.warning(
+                        "Archive is still unreachable, pausing the cuts for %.0fs.",
+                        cooldown,
+                    )
+                return
+            failures = [t for t in state["failures"] if now - t < self.window]
+            failures.append(now)
+            state["failures"] = failures
+            if len(failures) >= self.threshold:
+                state["open_until"] = now + state["cooldown"]
+                logging.warning(
+                    "%d archive errors in the last %.0fs, pausing the cuts for %.0fs.",
+                    len(failures),
+                    self.window,
+                    state["cooldown"],
+                )
+
+
+def _run_with_rusage(
+    args: list[str], env: dict[str, str]
+) -> tuple[int, str, resource.struct_rusage]:
+    """
+    Run a command and return its exit code, its stderr and its resource
+    usage, as reported by os.wait4().
+    """
+    with subprocess.Popen(
+        args,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=env,
+    ) as proc:
+        err = proc.stderr.read()
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, err, rusage
+
+
+def _file_sizes(path: pathlib.Path) -> dict[str, int]:
+    """
+    Return the size of the files directly in the directory at path, by name.
+    """
+    try:
+        with os.scandir(path) as it:
+            return {e.name: e.stat().st_size for e in it if e.is_file()}
+    except FileNotFoundError:
+        return {}
+
+
+def tree_size(path: str) -> int:
+    """
+    Return the total size of the regular files under path, in bytes.
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if stat.S_ISREG(st.st_mode):
+                total += st.st_size
+    return total
+
+
+def _cut_cache_bytes(
+    root: str, cache_path: pathlib.Path, added: dict[str, int], pkgs: set[str]
+) -> int:
+    """
+    Return the size of the debs installed by a cut into root among the
+    objects added to the chisel cache at cache_path while it ran, by name.
+    The cache is shared with the other workers, whose downloads must not
+    be charged to the cut: only the debs listed in the manifest of the cut
+    count or, without a manifest, the debs of pkgs.
+    """
+    manifest = read_manifest(root)
+    if manifest is not None:
+        digests = {p.get("sha256") for p in manifest.packages.values()}
+        return sum(size for name, size in added.items() if name in digests)
+    total = 0
+    for name, size in added.items():
+        path = str(cache_path / name)
+        if not is_deb(path):
+            continue
+        try:
+            pkg = read_deb(path, files=False).control.get("Package")
+        except (OSError, ValueError, tarfile.TarError):
+            continue
+        if pkg in pkgs:
+            total += size
+    return total
+
+
 def chisel_cut(
     *,
     arch: str,
     release: str,
     root: str,
-    slice_name: str,
+    slice_names: list[str],
     chisel_version: str,
     cache_dir: str,
+    cache_keys: list[str] | None = None,
     n_retries: int = 3,
-) -> str | None:
+) -> CutResult:
     """
-    Run "chisel cut" to install the slice in the given root.
-    Retry up to n_retries times if a fetch error occurs.
-    Return an error message if something went wrong, or None on success.
+    Run "chisel cut" to install the slices in the given root.
+    Retry up to n_retries times, with a backoff, if a fetch error occurs.
+    The fetch errors of all the workers sharing cache_dir feed an
+    ArchiveBreaker, which pauses the cuts when the archive is unreachable.
+    Each attempt holds the shared_cache_lock of cache_keys, but only while
+    chisel runs: the breaker pause and the backoff happen without it, so
+    that the other workers waiting on the keys are not held up.
+    Return the CutResult, whose error is set if something went wrong.
     """
+    slice_name = " ".join(slice_names)
+    start = time.perf_counter()
     env = dict(os.environ)
     env["XDG_CACHE_HOME"] = str(cache_dir)
+    cache_path = chisel_cache_path(cache_dir)
+    cached = _file_sizes(cache_path)
+    breaker = ArchiveBreaker(pathlib.Path(cache_dir) / "archive-breaker.json")
 
     args = ["chisel", "cut", "--arch", arch, "--release", release, "--root", root]
     if chisel_version.lstrip("v").split("+", 1)[0] > "1.2.0":
         args += ["--ignore=unstable"]
-    args += [slice_name]
+    args += slice_names
 
+    user_time = sys_time = 0.0
+    peak_rss = 0
+    matched: None | str = None
     for attempt in range(1, n_retries + 1):
-        res = subprocess.run(
-            args,
-            capture_output=True,
-            text=True,
-            check=False,
-            env=env,
-        )
-        if res.returncode == 0:
-            return None
-        err = res.stderr.rstrip()
-
-        # Match stderr against known patterns to retry
-        matched: None | str = None
-        for pattern in _patterns_to_retry:
-            if pattern in err:
-                matched = pattern
-                break
-        
-        if attempt < n_retries and matched is not None:
+        if breaker.wait():
+            logging.info("Probing the archive with %s...", slice_name)
+        with shared_cache_lock(cache_dir, cache_keys or []) as mark_cached:
+            returncode, err, rusage = _run_with_rusage(args, env)
+            # Match stderr against known patterns to retry
+            pattern = None if returncode == 0 else match_archive_error(err)
+            if pattern is None:
+                mark_cached()
+        user_time += rusage.ru_utime
+        sys_time += rusage.ru_stime
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss = max(peak_rss, rusage.ru_maxrss * 1024)
+        if returncode == 0:
+            breaker.record(archive_error=False)
+            err = None
+            break
+        err = err.rstrip()
+
+        retry = pattern is not None
+        if retry:
+            matched = pattern
+        breaker.record(archive_error=retry)
+
+        if attempt < n_retries and retry:
+            delay = retry_delay(attempt)
             logging.warning(
-                "Error while installing %s (attempt %d/%d): %s. Retrying...",
+                "Error while installing %s (attempt %d/%d): %s. Retrying in %.1fs...",
                 slice_name,
                 attempt,
                 n_retries,
                 matched,
+                delay,
             )
+            time.sleep(delay)
             continue
-        return err
+        break
+
+    added = {
+        name: size
+        for name, size in _file_sizes(cache_path).items()
+        if name not in cached
+    }
+    pkgs = {name.split("_", 1)[0] for name in slice_names}
+    return CutResult(
+        slice_name,
+        err,
+        attempt,
+        time.perf_counter() - start,
+        user_time=user_time,
+        sys_time=sys_time,
+        peak_rss=peak_rss,
+        cache_bytes=_cut_cache_bytes(root, cache_path, added, pkgs),
+        root_bytes=tree_size(root),
+        retry_pattern=matched,
+    )
+
+
+class CutHistory:
+    """
+    Local store of the outcome and duration of past cuts, keyed by
+    (release, arch, chisel version, slice), used to estimate how long a cut
+    will take.
+    """
+
+    # Estimated duration of a cut, in seconds, for slices with no history.
+    DEFAULT_ESTIMATE = 30.0
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cuts (
+                release TEXT NOT NULL,
+                arch TEXT NOT NULL,
+                chisel_version TEXT NOT NULL,
+                slice TEXT NOT NULL,
+                duration REAL NOT NULL,
+                retries INTEGER NOT NULL,
+                outcome TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (release, arch, chisel_version, slice)
+            )
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def record(
+        self, *, release: str, arch: str, chisel_version: str, result: CutResult
+    ) -> None:
+        """
+        Record the result of a cut, replacing the previous one.
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cuts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                release,
+                arch,
+                chisel_version,
+                result.slice_name,
+                result.duration,
+                result.attempts - 1,
+                "failure" if result.error else "success",
+                time.time(),
+            ),
+        )
+
+    def estimate(
+        self, *, release: str, arch: str, chisel_version: str, slice_name: str
+    ) -> float:
+        """
+        Return the expected duration of a cut. Fall back to the average over
+        other arches and chisel versions of the release, and then to
+        DEFAULT_ESTIMATE if the slice was never cut.
+        """
+        row = self.conn.execute(
+            "SELECT duration FROM cuts WHERE release = ? AND arch = ? "
+            "AND chisel_version = ? AND slice = ?",
+            (release, arch, chisel_version, slice_name),
+        ).fetchone()
+        if row is None:
+            row = self.conn.execute(
+                "SELECT AVG(duration) FROM cuts WHERE release = ? AND slice = ?",
+                (release, slice_name),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return self.DEFAULT_ESTIMATE
+        return row[0]
+
+
+class ResultsCache:
+    """
+    Local store of the keys of the successful cuts (see cut_key()), used to
+    skip the cuts whose inputs did not change since they last succeeded.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                slice TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+            """
+        )
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def has(self, key: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None
+
+    def add(self, key: str, slice_name: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (key, slice_name, time.time()),
+        )
+
+
+def cut_key(
+    *,
+    slice_name: str,
+    graph: dict[str, set[str]],
+    digests: dict[str, str],
+    chisel_version: str,
+    arch: str,
+    config: str,
+    versions: dict[str, str],
+) -> str | None:
+    """
+    Return the key of the cut of slice_name in the ResultsCache, made of the
+    digests of the slice definition files of the slice and its transitive
+    essentials, the chisel version, the arch, the digest of chisel.yaml and
+    the digests of the Packages entries of their packages on the arch (see
+    PackageIndex.versions), so that an update of the archive only changes
+    the keys of the cuts of the updated packages.
+    Return None if the slice definition file of any of them is unknown.
+    """
+    key = hashlib.sha256(f"{slice_name}\n{chisel_version}\n{arch}\n{config}\n".encode())
+    closure = essentials_closure(graph, slice_name)
+    for pkg in sorted({name.split("_", 1)[0] for name in closure}):
+        if not digests.get(pkg):
+            return None
+        key.update(f"{pkg}:{digests[pkg]}:{versions.get(pkg, '')}\n".encode())
+    return key.hexdigest()
+
+
+def chisel_identity(chisel_version: str) -> str:
+    """
+    Return the chisel version qualified with the digest of the chisel binary,
+    since versions like "main" do not identify a single build of chisel.
+    """
+    path = shutil.which("chisel")
+    if path is None:
+        return chisel_version
+    with open(path, "rb") as f:
+        return f"{chisel_version}+{hashlib.sha256(f.read()).hexdigest()[:16]}"
+
+
+@dataclass
+class Manifest:
+    """
+    Contents of a chisel manifest: the full names of the installed slices,
+    the slices which installed each path (e.g. "/usr/bin/hello"), and the
+    packages they came from, by name, with their "version", "arch" and the
+    "sha256" of their deb.
+    """
+
+    slices: set[str] = field(default_factory=set)
+    paths: dict[str, set[str]] = field(default_factory=dict)
+    packages: dict[str, dict[str, str]] = field(default_factory=dict)
+
+
+def read_manifest(root: str) -> Manifest | None:
+    """
+    Read the chisel manifest of root, or return None if the cut did not
+    generate a manifest.
+    The manifest is a zstd-compressed "jsonwall" file: one JSON object per
+    line, among which {"kind": "slice", "name": "pkg_slice"} for each slice,
+    {"kind": "path", "path": "/...", "slices": [...]} for each path and
+    {"kind": "package", "name": "pkg", ...} for each package.
+    """
+    path = pathlib.Path(root) / CHISEL_MANIFEST
+    if zstandard is None or not path.is_file():
+        return None
+    manifest = Manifest()
+    with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as r:
+        for line in io.TextIOWrapper(r, encoding="utf-8"):
+            entry = json.loads(line)
+            if entry.get("kind") == "slice":
+                manifest.slices.add(entry["name"])
+            elif entry.get("kind") == "path":
+                manifest.paths[entry["path"]] = set(entry.get("slices", []))
+            elif entry.get("kind") == "package":
+                manifest.packages[entry["name"]] = entry
+    return manifest
+
+
+def chisel_cache_path(cache_dir: str) -> pathlib.Path:
+    """
+    Return the directory where chisel stores the downloaded archive objects
+    when XDG_CACHE_HOME is set to cache_dir.
+    """
+    return pathlib.Path(cache_dir) / "chisel" / "sha256"
+
+
+def _atomic_touch(path: pathlib.Path) -> None:
+    """
+    Create an empty file at path via a rename, so that concurrent readers
+    either see the file or not, but never a partially written one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    os.close(fd)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def shared_cache_lock(cache_dir: str, keys: list[str]) -> Iterator[Callable[[], None]]:
+    """
+    Serialize the first download of each key into the shared chisel cache.
+
+    Chisel stores every archive object (InRelease, Packages indices, debs)
+    in a content-addressed cache and writes them with atomic renames, so
+    concurrent cuts sharing the same cache never see partial files. However,
+    workers cutting from the same package at the same time would all miss
+    the cache and download the same objects. To avoid that, the first cut
+    of a key holds an exclusive lock on it until the key is marked as cached,
+    and every other worker waits for it. Once a key is cached, no lock is
+    taken any more.
+
+    Yield a callable which marks the keys as cached. It must be called after
+    any cut which reached the archive, even a failed one: the objects were
+    downloaded anyway, and otherwise the workers would keep cutting one at a
+    time behind every failing cut.
+    """
+    locks_dir = pathlib.Path(cache_dir) / "locks"
+    locks_dir.mkdir(parents=True, exist_ok=True)
+    # Keys are always locked in the same order to avoid deadlocks.
+    cold = [k for k in sorted(set(keys)) if not (locks_dir / f"{k}.done").exists()]
+    with ExitStack() as stack:
+        for key in cold:
+            lock_file = stack.enter_context(open(locks_dir / f"{key}.lock", "w"))
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        def mark_cached() -> None:
+            for key in cold:
+                _atomic_touch(locks_dir / f"{key}.done")
+
+        yield mark_cached
+
+
+@dataclass(frozen=True)
+class CutOptions:
+    """
+    Options shared by all the cuts of a run.
+    """
+
+    arch: str
+    release: str
+    chisel_version: str
+    cache_dir: str
+    dry_run: bool = False
+    # Version of the release archive, e.g. 22.04.
+    version: str = ""
+    batch_size: int = 1
+    # Directory of the scratch roots of the workers (see scratch_root()).
+    scratch_dir: str = ""
+    scratch_max_bytes: int = 512 * 1024 * 1024
+    # Slice generating the chisel manifest, added to every cut when the cuts
+    # cover several slices and the release defines it (see
+    # find_manifest_slice()).
+    manifest_slice: str = ""
+
+
+@dataclass
+class TaskResult:
+    """
+    Outcome of a task: the full names of the slices installed by its cuts,
+    and the results of the cuts themselves.
+    """
+
+    installed: set[str] = field(default_factory=set)
+    cuts: list[CutResult] = field(default_factory=list)
+
+
+@dataclass
+class Job:
+    """
+    Slices to install for an arch of a release, and the outcome of the cuts.
+    roots maps each slice to cut to the full names of the requested slices
+    its cut should install. graph is the essentials graph of the arch.
+    cut_keys maps the full names of the slices to cut to their keys in the
+    ResultsCache, if any.
+    """
+
+    archive: Archive
+    options: CutOptions
+    all_slices: list[tuple[str, str]]
+    roots: dict[tuple[str, str], set[str]]
+    graph: dict[str, set[str]] = field(default_factory=dict)
+    installed: set[str] = field(default_factory=set)
+    cut_keys: dict[str, str | None] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return f"ubuntu-{self.archive.version}/{self.options.arch}"
+
+    def expected(self, task: list[tuple[str, str]]) -> dict[str, dict[str, set[str]]]:
+        """
+        Return what the cuts of a task should install: the requested slices
+        covered by each slice of the task, with their essentials closures.
+        """
+        return {
+            full_slice_name(*s): {
+                name: essentials_closure(self.graph, name) for name in self.roots[s]
+            }
+            for s in task
+        }
+
+    def covered(self, slice_name: str) -> list[str]:
+        """
+        Return the full names of the requested slices installed by the cut
+        of slice_name, starting with slice_name itself.
+        """
+        names = self.roots.get(tuple(slice_name.split("_", 1)), set())
+        return [slice_name] + sorted(names - {slice_name})
+
+    def history_key(self) -> dict[str, str]:
+        """
+        Return the key of the cuts of this job in the CutHistory.
+        """
+        return {
+            "release": f"ubuntu-{self.archive.version}",
+            "arch": self.options.arch,
+            "chisel_version": self.options.chisel_version,
+        }
+
+
+class SliceReport:
+    """
+    Machine-readable report of a run, with one record per slice. Records are
+    appended to the JSON Lines file as the cuts complete, and the JUnit XML
+    file, with one test suite per job, is written when the report is closed.
+    The slices installed by the cut of another slice (see reduce_slices())
+    get a record of their own, with the "root" slice which was cut. They
+    inherit its status, but its usage is only attributed to the root.
+    """
+
+    def __init__(self, jsonl_path: str | None, junit_path: str | None) -> None:
+        self.jsonl = open(jsonl_path, "w") if jsonl_path else None
+        self.junit_path = junit_path
+        self.records: list[dict] = []
+
+    def close(self) -> None:
+        if self.jsonl is not None:
+            self.jsonl.close()
+        if self.junit_path:
+            self.write_junit(self.junit_path)
+
+    def add(self, job: Job, cut: CutResult) -> None:
+        """
+        Record the cut of a slice, and of the slices it installed.
+        """
+        root = cut.slice_name
+        for name in job.covered(root):
+            # The copyright files are checked for the package of each slice.
+            pkg = name.split("_", 1)[0]
+            copyright_missing = [pkg] if pkg in cut.copyright_missing else []
+            if cut.error is not None:
+                status = "failed"
+            elif copyright_missing:
+                status = "copyright-missing"
+            else:
+                status = "passed"
+            usage = cut if name == root else CutResult(name, None, 1, 0.0)
+            self._add(
+                job,
+                {
+                    "slice": name,
+                    "root": root,
+                    "status": status,
+                    "wall_time": round(usage.duration, 3),
+                    "cpu_time": round(usage.cpu_time, 3),
+                    "user_time": round(usage.user_time, 3),
+                    "sys_time": round(usage.sys_time, 3),
+                    "peak_rss": usage.peak_rss,
+                    "cache_bytes": usage.cache_bytes,
+                    "root_bytes": usage.root_bytes,
+                    "retries": usage.attempts - 1,
+                    "retry_pattern": usage.retry_pattern,
+                    "error": cut.error,
+                    "copyright_missing": copyright_missing,
+                },
+            )
+
+    def add_cached(self, job: Job, slice_name: str) -> None:
+        """
+        Record a slice whose cut was skipped by the ResultsCache, and the
+        slices it installed.
+        """
+        for name in job.covered(slice_name):
+            self._add(
+                job,
+                {
+                    "slice": name,
+                    "root": slice_name,
+                    "status": "cached",
+                    "wall_time": 0.0,
+                    "cpu_time": 0.0,
+                    "user_time": 0.0,
+                    "sys_time": 0.0,
+                    "peak_rss": 0,
+                    "cache_bytes": 0,
+                    "root_bytes": 0,
+                    "retries": 0,
+                    "retry_pattern": None,
+                    "error": None,
+                    "copyright_missing": [],
+                },
+            )
+
+    def _add(self, job: Job, fields: dict) -> None:
+        record = {
+            "job": job.name,
+            "arch": job.options.arch,
+            "release": f"ubuntu-{job.archive.version}",
+            "chisel_version": job.options.chisel_version,
+            **fields,
+        }
+        self.records.append(record)
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps(record) + "\n")
+            self.jsonl.flush()
+
+    def write_junit(self, path: str) -> None:
+        suites = ET.Element("testsuites")
+        by_job: dict[str, ET.Element] = {}
+        for record in self.records:
+            suite = by_job.get(record["job"])
+            if suite is None:
+                suite = ET.SubElement(suites, "testsuite", name=record["job"])
+                by_job[record["job"]] = suite
+            case = ET.SubElement(
+                suite,
+                "testcase",
+                name=record["slice"],
+                classname=record["job"],
+                time=f"{record['wall_time']:.3f}",
+            )
+            if record["status"] == "failed":
+                failure = ET.SubElement(case, "failure", message="chisel cut failed")
+                failure.text = record["error"]
+            elif record["status"] == "copyright-missing":
+                ET.SubElement(
+                    case,
+                    "failure",
+                    message="copyright file not installed for "
+                    + ", ".join(record["copyright_missing"]),
+                )
+            elif record["status"] == "cached":
+                ET.SubElement(
+                    case, "skipped", message="unchanged since it last succeeded"
+                )
+        for suite in by_job.values():
+            cases = suite.findall("testcase")
+            suite.set("tests", str(len(cases)))
+            failures = [c for c in cases if c.find("failure") is not None]
+            skipped = [c for c in cases if c.find("skipped") is not None]
+            suite.set("failures", str(len(failures)))
+            suite.set("skipped", str(len(skipped)))
+            suite.set("time", f"{sum(float(c.get('time')) for c in cases):.3f}")
+        ET.indent(suites)
+        ET.ElementTree(suites).write(path, encoding="utf-8", xml_declaration=True)
+
+
+# Scratch root of this worker process, by scratch directory.
+_scratch_roots: dict[str, pathlib.Path] = {}
+# Packages whose roots outgrew the scratch directory in this worker process.
+_large_packages: set[str] = set()
+
+
+def default_scratch_dir() -> str | None:
+    """
+    Return /dev/shm if it is a writable directory, else None for the default
+    temporary directory.
+    """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+        return "/dev/shm"
+    return None
+
+
+def _clear_dir(path: pathlib.Path) -> None:
+    """
+    Remove the contents of the directory at path.
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+
+
+@contextmanager
+def scratch_root(options: CutOptions, pkgs: set[str]) -> Iterator[tuple[str, bool]]:
+    """
+    Yield an empty directory to cut the slices of pkgs into, and whether it
+    is the scratch root of this worker. The scratch root lives in
+    options.scratch_dir and is emptied and reused by the next cut, which
+    avoids creating and deleting a temporary directory for every cut. The
+    large packages (see _large_packages), or a scratch directory with less
+    than options.scratch_max_bytes of free space, get a temporary directory
+    on disk instead.
+    """
+    scratch_dir = options.scratch_dir
+    if (
+        not scratch_dir
+        or pkgs & _large_packages
+        or shutil.disk_usage(scratch_dir).free < options.scratch_max_bytes
+    ):
+        with tempfile.TemporaryDirectory() as tmpfs:
+            yield tmpfs, False
+        return
+
+    root = _scratch_roots.get(scratch_dir)
+    if root is None:
+        root = pathlib.Path(tempfile.mkdtemp(prefix="root-", dir=scratch_dir))
+        _scratch_roots[scratch_dir] = root
+    try:
+        yield str(root), True
+    finally:
+        try:
+            _clear_dir(root)
+        except OSError:
+            # Start afresh with a new root, the run cleans up scratch_dir.
+            del _scratch_roots[scratch_dir]
 
 
 def install_slices(
-    chunk: list[tuple[str, str]], dry_run: bool, arch: str, release: str, worker: int, chisel_version: str
+    task: list[tuple[str, str]],
+    options: CutOptions,
+    expected: dict[str, dict[str, set[str]]],
+) -> TaskResult:
+    """
+    Install the slices of a task by running "chisel cut", one batch of
+    options.batch_size slices after the other. A failing cut does not stop
+    the task, unless the run was aborted (see abort_marker()).
+    All the workers share the same chisel cache in options.cache_dir.
+    expected maps the slices of the task to the requested slices each cut
+    should install, and those to their essentials closures, against which
+    their copyright files are checked (see Job.expected()).
+    """
+    result = TaskResult()
+    aborted = abort_marker(options.cache_dir)
+    for i in range(0, len(task), options.batch_size):
+        if aborted.exists():
+            break
+        batch = task[i : i + options.batch_size]
+        for pkg, slice in batch:
+            logging.info(
+                "Installing %s on ubuntu-%s/%s...",
+                full_slice_name(pkg, slice),
+                options.version,
+                options.arch,
+            )
+        if options.dry_run:
+            continue
+        _install_batch(batch, options, expected, result)
+    return result
+
+
+def abort_marker(cache_dir: str) -> pathlib.Path:
+    """
+    Return the path of the file which tells the workers sharing cache_dir
+    to stop installing slices, once the run reached --max-failures.
+    """
+    return pathlib.Path(cache_dir) / "abort"
+
+
+def _install_batch(
+    batch: list[tuple[str, str]],
+    options: CutOptions,
+    expected: dict[str, dict[str, set[str]]],
+    result: TaskResult,
+) -> bool:
+    """
+    Install a batch of slices with a single "chisel cut", adding the outcome
+    to result. If the cut fails, bisect the batch until the failing slices
+    are isolated, so that each error is attributed to a single slice.
+    Return whether all the slices of the batch were installed.
+    """
+    arch = options.arch
+    cache_dir = options.cache_dir
+    version = options.version
+    names = [full_slice_name(pkg, slice) for pkg, slice in batch]
+    pkgs = {pkg for pkg, _ in batch}
+    slice_names = list(names)
+    if options.manifest_slice and options.manifest_slice not in names:
+        slice_names.append(options.manifest_slice)
+    cache_keys = [f"index-{version}-{arch}"]
+    cache_keys += [f"deb-{version}-{arch}-{pkg}" for pkg in pkgs]
+    with scratch_root(options, pkgs) as (root, on_scratch):
+        cut = chisel_cut(
+            arch=arch,
+            release=options.release,
+            root=root,
+            cache_dir=cache_dir,
+            cache_keys=cache_keys,
+            slice_names=slice_names,
+            chisel_version=options.chisel_version,
+        )
+        cut.slice_name = " ".join(names)
+        if on_scratch and cut.root_bytes > options.scratch_max_bytes:
+            _large_packages.update(pkgs)
+        if cut.error is None:
+            _check_installed_slices(root, cut, names, options, expected, result)
+            return True
+
+    if on_scratch and "no space left on device" in cut.error:
+        logging.warning(
+            "Scratch directory is full, installing %s on disk...", " ".join(names)
+        )
+        _large_packages.update(pkgs)
+        return _install_batch(batch, options, expected, result)
+
+    if len(batch) == 1:
+        result.cuts.append(cut)
+        logging.error("==============================================\n%s", cut.error)
+        return False
+    logging.warning(
+        "Error while installing %d slices together (%s ... %s). Bisecting...",
+        len(batch),
+        names[0],
+        names[-1],
+    )
+    mid = len(batch) // 2
+    first = _install_batch(batch[:mid], options, expected, result)
+    second = _install_batch(batch[mid:], options, expected, result)
+    return first and second
+
+
+def _check_installed_slices(
+    root: str,
+    cut: CutResult,
+    names: list[str],
+    options: CutOptions,
+    expected: dict[str, dict[str, set[str]]],
+    result: TaskResult,
 ) -> None:
     """
-    Install the slice by running "chisel cut".
-    """
-    for i, (pkg, slice) in enumerate(chunk):
-        slice_name = full_slice_name(pkg, slice)
-        logging.info(
-            "Worker %d (%d/%d): Installing %s on %s...",
-            worker,
-            i,
-            len(chunk),
-            slice_name,
-            arch,
+    Record which slices a successful cut of names installed in root, and
+    check their copyright files. Add a CutResult for each of the slices to
+    result, sharing the duration and resources of the cut between them.
+    """
+    covers = {name: expected.get(name, {name: {name}}) for name in names}
+    cuts = {
+        name: replace(
+            cut,
+            slice_name=name,
+            duration=cut.duration / len(names),
+            user_time=cut.user_time / len(names),
+            sys_time=cut.sys_time / len(names),
+            cache_bytes=cut.cache_bytes // len(names),
+            root_bytes=cut.root_bytes // len(names),
+            copyright_missing=[],
         )
-        if dry_run:
-            continue
-        with tempfile.TemporaryDirectory() as tmpfs, tempfile.TemporaryDirectory() as cache_dir:
-            err = chisel_cut(
-                arch=arch,
-                release=release,
-                root=tmpfs,
-                cache_dir=cache_dir,
-                slice_name=slice_name,
-                chisel_version=chisel_version,
+        for name in names
+    }
+    result.cuts += cuts.values()
+
+    manifest = read_manifest(root)
+    if manifest is None and options.manifest_slice:
+        err = f"cannot read the chisel manifest {CHISEL_MANIFEST} of the cut"
+        logging.error("==============================================\n%s", err)
+        for name in names:
+            cuts[name].error = err
+        return
+    if manifest is None:
+        # The release does not generate a manifest, so rely on the
+        # slices the cut should install instead.
+        result.installed |= {n for c in covers.values() for n in c}
+    else:
+        result.installed |= manifest.slices
+
+    # Check that the copyright file of each requested slice was installed
+    # by the slice or its essentials, as if it was cut on its own.
+    for name in names:
+        for covered, closure in sorted(covers[name].items()):
+            covered_pkg = covered.split("_", 1)[0]
+            if covered_pkg in cuts[name].copyright_missing:
+                continue
+            if manifest is not None and covered not in manifest.slices:
+                continue
+            if copyright_installed(root, covered_pkg, closure, manifest):
+                continue
+            # Does the copyright file exist in the deb? The cache is shared
+            # by all the arches and releases, so look for the deb of the
+            # arch and, if known from the manifest, of the installed version.
+            version = None
+            if manifest is not None:
+                version = manifest.packages.get(covered_pkg, {}).get("version")
+            if deb_has_copyright_file(
+                covered_pkg,
+                chisel_cache_path(options.cache_dir),
+                arch=options.arch,
+                version=version,
+            ):
+                err = "{} has a copyright file but it wasn't installed with {}.".format(
+                    covered_pkg,
+                    covered,
+                )
+                logging.error(err)
+                cuts[name].copyright_missing.append(covered_pkg)
+
+
+def copyright_installed(
+    root: str, pkg: str, closure: set[str], manifest: Manifest | None
+) -> bool:
+    """
+    Check whether the copyright file of pkg was installed in root by one of
+    the slices of closure, according to the chisel manifest of the cut. The
+    slices which installed the file are unknown without a manifest, in which
+    case it is enough for the file to be in root.
+    """
+    path = f"usr/share/doc/{pkg}/copyright"
+    if manifest is not None:
+        return not manifest.paths.get(f"/{path}", set()).isdisjoint(closure)
+    copyright_file = pathlib.Path(root) / path
+    return copyright_file.is_file() or copyright_file.is_symlink()
+
+
+def report_coverage(
+    all_slices: list[tuple[str, str]],
+    installed: set[str],
+    target: str | None = None,
+) -> list[str]:
+    """
+    Report the slices of all_slices which were not installed, directly or
+    indirectly, on target (e.g. an arch), and return their full names.
+    """
+    on_target = f" on {target}" if target else ""
+    not_installed = sorted(
+        name
+        for name in (full_slice_name(pkg, slice) for pkg, slice in all_slices)
+        if name not in installed
+    )
+    if not_installed:
+        logging.error(
+            "The following %d slices were not installed%s:\n%s",
+            len(not_installed),
+            on_target,
+            "\n".join(f"  - {s}" for s in not_installed),
+        )
+    else:
+        logging.info("All %d slices were installed%s.", len(all_slices), on_target)
+    return not_installed
+
+
+def _format_size(size: float) -> str:
+    """
+    Return a size in bytes in a human-readable form.
+    """
+    if size < 1024:
+        return f"{size:.0f}B"
+    for unit in ["KiB", "MiB"]:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+    return f"{size / 1024:.1f}GiB"
+
+
+def report_resources(cuts: list[tuple[str, CutResult]], top: int = 20) -> None:
+    """
+    Log the resources used by the cuts, summarized per release and for the
+    top packages by CPU time. cuts pairs each cut with its release.
+    """
+    if not cuts:
+        return
+    totals: dict[str, dict[str, dict[str, float]]] = {"release": {}, "package": {}}
+    for release, cut in cuts:
+        pkg = cut.slice_name.split("_", 1)[0]
+        for kind, key in [("release", release), ("package", pkg)]:
+            t = totals[kind].setdefault(
+                key,
+                {"cuts": 0, "cpu": 0.0, "rss": 0, "cache": 0, "root": 0},
             )
-            if err:
-                logging.error("==============================================\n%s", err)
-                return
+            t["cuts"] += 1
+            t["cpu"] += cut.cpu_time
+            t["rss"] = max(t["rss"], cut.peak_rss)
+            t["cache"] += cut.cache_bytes
+            t["root"] += cut.root_bytes
+
+    def lines(items: list[tuple[str, dict[str, float]]]) -> str:
+        return "\n".join(
+            f"  - {key}: {t['cuts']} cuts, CPU {t['cpu']:.1f}s, "
+            f"peak RSS {_format_size(t['rss'])}, "
+            f"cache {_format_size(t['cache'])}, root {_format_size(t['root'])}"
+            for key, t in items
+        )
+
+    by_release = sorted(totals["release"].items())
+    logging.info("Resources used per release:\n%s", lines(by_release))
+    by_cpu = sorted(totals["package"].items(), key=lambda i: i[1]["cpu"], reverse=True)
+    logging.info(
+        "Resources used by the top %d packages by CPU time:\n%s",
+        min(top, len(by_cpu)),
+        lines(by_cpu[:top]),
+    )
+
+
+# A deb is an "ar" archive whose first member is "debian-binary".
+DEB_MAGIC = b"!<arch>\ndebian-binary"
+
+_AR_HEADER_SIZE = 60
+
+
+def is_deb(path: str) -> bool:
+    """
+    Check whether the file at path is a deb, from its first bytes.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(DEB_MAGIC)) == DEB_MAGIC
+    except OSError:
+        return False
+
+
+class _ArMember(io.RawIOBase):
+    """
+    Read-only stream over the data of an "ar" archive member.
+    """
+
+    def __init__(self, f: io.BufferedReader, size: int) -> None:
+        self.f = f
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self.f.readinto(memoryview(buffer)[: self.remaining])
+        self.remaining -= n
+        return n
+
+
+def _ar_members(f: io.BufferedReader) -> Iterator[tuple[str, _ArMember]]:
+    """
+    Iterate over the members of an "ar" archive, yielding their names and
+    data streams. Each stream is only valid until the next iteration.
+    """
+    if f.read(8) != b"!<arch>\n":
+        raise ValueError("not an ar archive")
+    offset = 8
+    while True:
+        f.seek(offset)
+        header = f.read(_AR_HEADER_SIZE)
+        if len(header) < _AR_HEADER_SIZE:
+            return
+        name = header[:16].decode().strip().rstrip("/")
+        size = int(header[48:58])
+        yield name, _ArMember(f, size)
+        # Members are aligned to even offsets.
+        offset += _AR_HEADER_SIZE + size + size % 2
+
+
+def _open_tar_member(name: str, member: _ArMember) -> tarfile.TarFile:
+    """
+    Open a (compressed) tarball member of a deb as a tar stream.
+    """
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {name}")
+        stream = zstandard.ZstdDecompressor().stream_reader(member)
+        return tarfile.open(fileobj=stream, mode="r|")
+    # gz, xz, bz2 and uncompressed tarballs are detected by tarfile.
+    return tarfile.open(fileobj=member, mode="r|*")
+
+
+def _parse_control(content: str) -> dict[str, str]:
+    """
+    Parse the fields of a deb's control file. Multi-line fields are joined.
+    """
+    fields: dict[str, str] = {}
+    key = None
+    for line in content.splitlines():
+        if line[:1] in (" ", "\t") and key is not None:
+            fields[key] += "\n" + line.strip()
+        elif ":" in line:
+            key, value = line.split(":", 1)
+            fields[key] = value.strip()
+    return fields
+
+
+@dataclass
+class DebContents:
+    """
+    Control fields and file list of a deb.
+    """
+
+    control: dict[str, str]
+    files: list[str] = field(default_factory=list)
+
+
+def read_deb(path: str, files: bool = True) -> DebContents:
+    """
+    Read the control fields and, if files is set, the file list of a deb,
+    streaming its control.tar.* and data.tar.* members. The file list holds
+    the paths relative to the root, e.g. "usr/share/doc/pkg/copyright".
+    """
+    contents = DebContents({})
+    with open(path, "rb") as f:
+        for name, member in _ar_members(f):
+            if name.startswith("control.tar"):
+                with _open_tar_member(name, member) as tar:
+                    for info in tar:
+                        if info.name.removeprefix("./") == "control":
+                            control = tar.extractfile(info)
+                            if control is not None:
+                                contents.control = _parse_control(
+                                    control.read().decode("utf-8", "replace")
+                                )
+                            break
+                if not files:
+                    break
+            elif name.startswith("data.tar") and files:
+                with _open_tar_member(name, member) as tar:
+                    for info in tar:
+                        path_in_deb = info.name.removeprefix("./").lstrip("/")
+                        if path_in_deb and path_in_deb != ".":
+                            contents.files.append(path_in_deb.rstrip("/"))
+    return contents
 
-            # Check if the copyright file has been installed with this slice
-            copyright_file = pathlib.Path(f"{tmpfs}/usr/share/doc/{pkg}/copyright")
-            if not copyright_file.is_file() and not copyright_file.is_symlink():
-                # Does the copyright file exist in the deb?
-                if deb_has_copyright_file(pkg):
-                    err = "{} has a copyright file but it wasn't installed.".format(
-                        pkg,
-                    )
-                    logging.error(err)
 
+class DebIndex:
+    """
+    Index of the debs in a chisel package cache, mapping package names to
+    the paths of their debs by (arch, version) and, once loaded, the paths
+    of the debs to their file lists. A cache shared by several arches or
+    releases holds several debs of the same package.
+
+    Each file of the cache is only inspected once: refresh() only looks at
+    the entries which appeared since the last refresh.
+    """
+
+    def __init__(self, pkg_cache: pathlib.Path) -> None:
+        self.pkg_cache = pkg_cache
+        self.seen: set[str] = set()
+        self.debs: dict[str, dict[tuple[str, str], str]] = {}
+        self.filelists: dict[str, list[str]] = {}
+
+    def refresh(self) -> None:
+        """
+        Index the debs which were added to the cache since the last refresh.
+        """
+        for sha_file in pathlib.Path(self.pkg_cache).rglob("*"):
+            deb_path = str(sha_file)
+            if deb_path in self.seen:
+                continue
+            self.seen.add(deb_path)
+            if not is_deb(deb_path):
+                continue
+            try:
+                control = read_deb(deb_path, files=False).control
+            except (OSError, ValueError, tarfile.TarError) as e:
+                logging.warning("Cannot read %s: %s", deb_path, e)
+                continue
+            sha_pkg = control.get("Package")
+            if sha_pkg:
+                key = (control.get("Architecture", ""), control.get("Version", ""))
+                self.debs.setdefault(sha_pkg, {}).setdefault(key, deb_path)
+
+    def find(
+        self, pkg: str, arch: str | None = None, version: str | None = None
+    ) -> str | None:
+        """
+        Return the path of the deb of pkg for arch (or "all") and version,
+        either of them matching any deb if not specified. Among several
+        matching debs, the most recently added to the cache is returned.
+        """
+        matches = [
+            path
+            for (deb_arch, deb_version), path in self.debs.get(pkg, {}).items()
+            if (arch is None or deb_arch in (arch, "all"))
+            and (version is None or deb_version == version)
+        ]
+        if not matches:
+            return None
+        return max(matches, key=lambda path: os.stat(path).st_mtime)
 
-def deb_has_copyright_file(pkg: str) -> bool:
+    def filelist(
+        self, pkg: str, arch: str | None = None, version: str | None = None
+    ) -> list[str] | None:
+        """
+        Return the file list of the deb of pkg for arch and version (see
+        find()), or None if it is not in the cache.
+        """
+        deb_path = self.find(pkg, arch, version)
+        if deb_path is None:
+            self.refresh()
+            deb_path = self.find(pkg, arch, version)
+        if deb_path is None:
+            return None
+        if deb_path not in self.filelists:
+            self.filelists[deb_path] = read_deb(deb_path).files
+        return self.filelists[deb_path]
+
+
+# Index of each chisel package cache, built once per process.
+_deb_indices: dict[str, DebIndex] = {}
+
+
+def deb_has_copyright_file(
+    pkg: str,
+    pkg_cache: pathlib.Path = CHISEL_PKG_CACHE,
+    arch: str | None = None,
+    version: str | None = None,
+) -> bool:
     """
-    Checks if a deb's contents comprise a copyright file
+    Checks if a deb's contents comprise a copyright file, looking for the
+    deb of arch and version (any if not specified) in the chisel package
+    cache pkg_cache
 
     NOTE: this is a temporary and convoluted implementation, as at the moment
     we don't have an easy and reliable way to check which deb was used for
@@ -430,91 +2420,433 @@ def deb_has_copyright_file(pkg: str) -> bool:
     TODO: update this function once the Chisel DB is available, as the pkg
     SHAs will be available from the DB itself.
     """
-    for sha_file in pathlib.Path(CHISEL_PKG_CACHE).rglob("*"):
-        try:
-            sha_type = magic.from_file(str(sha_file), mime=True)
-        except:
-            # Ignore any other kind
-            continue
+    if str(pkg_cache) not in _deb_indices:
+        _deb_indices[str(pkg_cache)] = DebIndex(pkg_cache)
+    filelist = _deb_indices[str(pkg_cache)].filelist(pkg, arch, version)
+    if filelist is None:
+        return False
+    return f"usr/share/doc/{pkg}/copyright" in filelist
 
-        if sha_type and "debian.binary-package" in sha_type:
-            deb_path = str(pathlib.Path(CHISEL_PKG_CACHE / sha_file))
-            sha_pkg = os.popen(f"dpkg-deb -f {deb_path} Package").read().strip()
 
-            if sha_pkg == pkg:
-                deb = DebPackage(deb_path)
-                return f"usr/share/doc/{pkg}/copyright" in deb.filelist
+def make_batches(
+    slices: list[tuple[str, str]], batch_size: int
+) -> list[list[tuple[str, str]]]:
+    """
+    Split the slices into batches of at most batch_size slices, keeping the
+    slices of a package in the same batch where possible.
+    """
+    by_package: dict[str, list[tuple[str, str]]] = {}
+    for s in slices:
+        by_package.setdefault(s[0], []).append(s)
+    batches: list[list[tuple[str, str]]] = []
+    batch: list[tuple[str, str]] = []
+    for group in by_package.values():
+        if len(batch) + len(group) > batch_size and batch:
+            batches.append(batch)
+            batch = []
+        for i in range(0, len(group), batch_size):
+            batch += group[i : i + batch_size]
+            if len(batch) >= batch_size:
+                batches.append(batch)
+                batch = []
+    if batch:
+        batches.append(batch)
+    return batches
 
-    return False
 
+def package_tasks(
+    slices: list[tuple[str, str]], max_slices: int
+) -> list[list[tuple[str, str]]]:
+    """
+    Group the slices by package, so that all the slices of a package are
+    installed one after the other by the same worker, reusing the chisel
+    cache it has warmed up. Packages with more than max_slices slices are
+    split into several tasks so that they do not become stragglers.
+    """
+    by_package: dict[str, list[tuple[str, str]]] = {}
+    for s in slices:
+        by_package.setdefault(s[0], []).append(s)
+    tasks = []
+    for group in by_package.values():
+        n_chunks = math.ceil(len(group) / max_slices)
+        size = math.ceil(len(group) / n_chunks)
+        tasks += [group[i : i + size] for i in range(0, len(group), size)]
+    return tasks
 
-def main() -> None:
+
+def assign_files_to_releases(
+    files: list[str], releases: list[str]
+) -> dict[str, list[str]]:
     """
-    The main function -- execution should start from here.
+    Assign each slice definition file to the release directory containing it.
+    With a single release, all the files belong to it.
+    """
+    if len(releases) == 1:
+        return {releases[0]: list(files)}
+    assigned: dict[str, list[str]] = {release: [] for release in releases}
+    for file in files:
+        path = pathlib.Path(file).resolve()
+        owners = [
+            release
+            for release in releases
+            if os.path.isdir(release)
+            and path.is_relative_to(pathlib.Path(release).resolve())
+        ]
+        if not owners:
+            logging.error("%s: not in any of the release directories", file)
+            sys.exit(1)
+        # With nested release directories, the innermost one wins.
+        owner = max(owners, key=lambda r: len(pathlib.Path(r).resolve().parts))
+        assigned[owner].append(file)
+    return assigned
+
+
+def plan_release_jobs(
+    release: str,
+    files: list[str],
+    arches: list[str],
+    cli_args: argparse.Namespace,
+    cache_dir: str,
+    scratch_dir: str,
+    index_path: str | None,
+) -> list[Job]:
+    """
+    Parse the slice definition files of a release, run the existence checks
+    and plan the Job of each arch.
     """
-    configure_logging()
-    cli_args = parse_args()
     # Parse slice definition files.
-    packages = []
-    for file in cli_args.files:
-        pkg = parse_package(file)
-        packages.append(pkg)
+    packages = parse_packages(files, cli_args.workers)
+    archive = parse_archive(release)
+    # Both existence checks, and the keys of the ResultsCache, are answered
+    # by the same index of the archive, which is only built once. It only
+    # covers the arches to install unless the existence of the packages on
+    # any arch is checked.
+    index = None
+    if cli_args.ensure_existence or cli_args.ignore_missing or cli_args.results_cache:
+        index = load_or_build_package_index(
+            archive,
+            backend="index" if cli_args.results_cache else cli_args.existence_backend,
+            mirror=cli_args.archive_mirror,
+            path=index_path,
+            arches=None if cli_args.ensure_existence else arches,
+        )
     # Ensure package existence for at least one architecture. This means that
     # each package must be present in the archive for at least one of the
     # architectures.
     if cli_args.ensure_existence:
-        archive = parse_archive(cli_args.release)
-        ensure_package_existence([p.package for p in packages], archive)
-    # Ignore packages who do not exist in the archive for this particular
-    # architecture.
-    if cli_args.ignore_missing:
-        packages, ignored = ignore_missing_packages(
-            packages, cli_args.arch, cli_args.release
+        ensure_package_existence(
+            [p.package for p in packages],
+            archive,
+            backend=cli_args.existence_backend,
+            mirror=cli_args.archive_mirror,
+            index=index,
+        )
+    release_packages: dict[str, Package] = {}
+    if cli_args.reduce_essentials or cli_args.results_cache:
+        # The slice definition files given on the command line were already
+        # parsed, only the rest of the release is.
+        known = {os.path.realpath(f): p for f, p in zip(files, packages)}
+        release_packages = {
+            p.package: p
+            for p in parse_release_packages(release, cli_args.workers, known)
+        }
+        release_packages.update((p.package, p) for p in packages)
+    digests = {p.package: p.digest for p in release_packages.values()}
+    batch_size = max(cli_args.batch_size, 1)
+    # The manifest is only needed to tell apart the slices installed by a cut
+    # of several of them, i.e. of a reduced root or of a batch. Otherwise the
+    # cuts are left as they are.
+    manifest_slice = ""
+    if cli_args.reduce_essentials or batch_size > 1:
+        manifest_slice = find_manifest_slice(
+            release, list(release_packages.values()) or packages
+        )
+    if cli_args.reduce_essentials and not manifest_slice:
+        logging.error(
+            "%s does not define %s, whose manifest --reduce-essentials needs "
+            "to verify the installed slices",
+            release,
+            full_slice_name(*CHISEL_MANIFEST_SLICE),
+        )
+        sys.exit(1)
+    if cli_args.reduce_essentials and zstandard is None:
+        logging.error(
+            "zstandard is required to read the chisel manifest with "
+            "--reduce-essentials"
         )
-        if len(ignored) > 0:
-            logging.info("The following packages will be IGNORED:")
-            for pkg in ignored:
+        sys.exit(1)
+    if batch_size > 1 and (not manifest_slice or zstandard is None):
+        # Without a manifest, the copyright files found in the root of a
+        # batch cannot be attributed to the slices which installed them.
+        logging.warning(
+            "Cannot read the manifest of %s in %s, installing one slice at a time.",
+            full_slice_name(*CHISEL_MANIFEST_SLICE),
+            release,
+        )
+        batch_size = 1
+        manifest_slice = ""
+    chisel = chisel_identity(cli_args.chisel_version) if cli_args.results_cache else ""
+
+    jobs: list[Job] = []
+    for arch in arches:
+        arch_packages = packages
+        # Ignore packages who do not exist in the archive for this particular
+        # architecture.
+        if cli_args.ignore_missing:
+            arch_packages, ignored = ignore_missing_packages(
+                packages,
+                arch,
+                release,
+                backend=cli_args.existence_backend,
+                mirror=cli_args.archive_mirror,
+                index=index,
+            )
+            if len(ignored) > 0:
+                logging.info(
+                    "The following packages will be IGNORED on ubuntu-%s/%s:",
+                    archive.version,
+                    arch,
+                )
+                for pkg in ignored:
+                    logging.info("  - %s", pkg.package)
+        #
+        if len(arch_packages) > 0:
+            logging.info(
+                "Slices of the following %s packages will be INSTALLED on "
+                "ubuntu-%s/%s (available workers=%s):",
+                len(arch_packages),
+                archive.version,
+                arch,
+                cli_args.workers,
+            )
+            for pkg in arch_packages:
                 logging.info("  - %s", pkg.package)
-    #
-    if len(packages) > 0:
-        logging.info(
-            "Slices of the following %s packages will be INSTALLED (available workers=%s):",
-            len(packages),
-            cli_args.workers,
+        else:
+            logging.info("No slices will be installed on ubuntu-%s/%s.", archive.version, arch)
+            continue
+
+        all_slices = [
+            (pkg.package, slice) for pkg in arch_packages for slice in pkg.slices
+        ]
+        graph = essentials_graph(list(release_packages.values()) or packages, arch)
+        # Many slices get installed anyway as essentials of other slices.
+        # Only cut the "root" slices, keeping track of which slices each cut
+        # should install.
+        if cli_args.reduce_essentials:
+            roots = reduce_slices(all_slices, graph)
+            logging.info(
+                "Reduced %d slices to %d root slices to cut on ubuntu-%s/%s.",
+                len(all_slices),
+                len(roots),
+                archive.version,
+                arch,
+            )
+        else:
+            roots = {s: {full_slice_name(*s)} for s in all_slices}
+        options = CutOptions(
+            arch=arch,
+            release=release,
+            chisel_version=cli_args.chisel_version,
+            cache_dir=cache_dir,
+            dry_run=cli_args.dry_run,
+            version=archive.version,
+            batch_size=batch_size,
+            scratch_dir=scratch_dir,
+            scratch_max_bytes=cli_args.scratch_max_size * 1024 * 1024,
+            manifest_slice=manifest_slice,
         )
-        for pkg in packages:
-            logging.info("  - %s", pkg.package)
-    else:
-        logging.info("No slices will be installed.")
-        return
+        job = Job(archive, options, all_slices, roots, graph)
+        if cli_args.results_cache:
+            for s in roots:
+                job.cut_keys[full_slice_name(*s)] = cut_key(
+                    slice_name=full_slice_name(*s),
+                    graph=graph,
+                    digests=digests,
+                    chisel_version=chisel,
+                    arch=arch,
+                    config=archive.digest,
+                    versions=index.versions.get(arch, {}),
+                )
+        jobs.append(job)
+    return jobs
 
-    # TODO: this list of slices can still be reduced, since many of these
-    # will come as essentials of other slices. We could simply crawl all essentials
-    # in the release, and remove them from the "all_slices" list (since they
-    # are going to get installed anyway). The problem here is accounting: I'd like
-    # to ensure that all slices are still installed nonetheless, even if indirectly,
-    # but that means `install_slices` will have to be aware of the nested essentials.
-    all_slices = [(pkg.package, slice) for pkg in packages for slice in pkg.slices]
-
-    chunk_size = math.ceil(len(all_slices) / cli_args.workers)
-    chunks_of_slices: list[tuple[list[tuple[str, str]], bool, str, str, int, str]] = [
-        (
-            all_slices[i : i + chunk_size],
-            cli_args.dry_run,
-            cli_args.arch,
-            cli_args.release,
-            i // chunk_size + 1,  # worker number
-            cli_args.chisel_version,
+
+def main() -> None:
+    """
+    The main function -- execution should start from here.
+    """
+    configure_logging()
+    cli_args = parse_args()
+    arches = list(dict.fromkeys(a.strip() for a in cli_args.arch.split(",") if a.strip()))
+    # The release directories are normalized so that parse_archive() does
+    # not mistake them for branches.
+    release_dirs = [os.path.join(d, "") for d in cli_args.release_dir]
+    releases = list(dict.fromkeys(cli_args.release + release_dirs))
+    files = list(cli_args.files)
+    if cli_args.files0_from:
+        files += read_files0(cli_args.files0_from)
+    files_by_release = assign_files_to_releases(files, releases)
+    for release in release_dirs:
+        found = find_slice_definitions(release)
+        logging.info("Found %d slice definition files in %s", len(found), release)
+        files_by_release[release] = list(
+            dict.fromkeys(files_by_release[release] + found)
         )
-        for i in range(0, len(all_slices), chunk_size)
-    ]
 
-    with ProcessPoolExecutor() as executor:
-        futures = [
-            executor.submit(install_slices, *chunk) for chunk in chunks_of_slices
-        ]
-        _ = [future.result() for future in as_completed(futures)]
+    with ExitStack() as stack:
+        stack.enter_context(log_listener())
+        if cli_args.cache_dir:
+            cache_dir = cli_args.cache_dir
+            os.makedirs(cache_dir, exist_ok=True)
+        else:
+            cache_dir = stack.enter_context(
+                tempfile.TemporaryDirectory(prefix="chisel-cache-")
+            )
+        scratch_dir = stack.enter_context(
+            tempfile.TemporaryDirectory(
+                prefix="chisel-roots-",
+                dir=cli_args.scratch_dir or default_scratch_dir(),
+            )
+        )
+
+        # Plan the slices to install on each arch of each release.
+        jobs: list[Job] = []
+        for i, release in enumerate(releases):
+            index_path = cli_args.existence_index
+            if index_path and len(releases) > 1:
+                # Each release gets its own index file.
+                root, ext = os.path.splitext(index_path)
+                index_path = f"{root}-{i}{ext}"
+            jobs += plan_release_jobs(
+                release,
+                files_by_release[release],
+                arches,
+                cli_args,
+                cache_dir,
+                scratch_dir,
+                index_path,
+            )
+
+        if not jobs:
+            logging.info("No slices will be installed.")
+            return
+
+        report = SliceReport(cli_args.report_jsonl, cli_args.report_junit)
+        stack.callback(report.close)
+        usage: list[tuple[str, CutResult]] = []
+
+        # Skip the cuts which already succeeded with the same inputs.
+        results: ResultsCache | None = None
+        if cli_args.results_cache:
+            results = ResultsCache(cli_args.results_cache)
+            for job in jobs:
+                unchanged = [
+                    s
+                    for s in job.roots
+                    if (key := job.cut_keys.get(full_slice_name(*s))) and results.has(key)
+                ]
+                for s in unchanged:
+                    report.add_cached(job, full_slice_name(*s))
+                    job.installed |= job.roots.pop(s)
+                if unchanged:
+                    logging.info(
+                        "Skipping %d cuts on %s, unchanged since they last succeeded.",
+                        len(unchanged),
+                        job.name,
+                    )
+        logging.info("Using shared chisel cache in %s", cache_dir)
+        abort_marker(cache_dir).unlink(missing_ok=True)
+
+        # The cuts of all the arches and releases are scheduled together.
+        if cli_args.package_affinity:
+            n_slices = sum(len(job.roots) for job in jobs)
+            max_slices = max(
+                math.ceil(n_slices / max(cli_args.workers, 1)),
+                jobs[0].options.batch_size,
+            )
+            tasks = [
+                (job, task)
+                for job in jobs
+                for task in package_tasks(list(job.roots), max_slices)
+            ]
+        else:
+            tasks = [
+                (job, batch)
+                for job in jobs
+                for batch in make_batches(list(job.roots), job.options.batch_size)
+            ]
+
+        # Start the cuts expected to take the longest first, so that they do
+        # not end up alone at the tail of the run.
+        history: CutHistory | None = None
+        if cli_args.history_db:
+            history = CutHistory(cli_args.history_db)
+            estimates = [
+                sum(
+                    history.estimate(**job.history_key(), slice_name=full_slice_name(*s))
+                    for s in task
+                )
+                for job, task in tasks
+            ]
+            order = sorted(range(len(tasks)), key=lambda i: estimates[i], reverse=True)
+            tasks = [tasks[i] for i in order]
+            logging.info("Expected total cut time: %.0fs", sum(estimates))
+
+        # Submit one task per slice (or batch of slices, or package). Idle
+        # workers pull the next task from the executor's queue, so that the
+        # wall-clock time is driven by the total amount of work rather than
+        # by the slowest group of slices.
+        with worker_pool(cli_args.workers) as executor:
+            futures = {
+                executor.submit(
+                    install_slices,
+                    task,
+                    job.options,
+                    job.expected(task),
+                ): job
+                for job, task in tasks
+            }
+            failures = 0
+            for n_done, future in enumerate(as_completed(futures), 1):
+                if future.cancelled():
+                    continue
+                job = futures[future]
+                task_result = future.result()
+                failures += sum(1 for cut in task_result.cuts if not cut.succeeded)
+                if (
+                    cli_args.max_failures is not None
+                    and failures >= cli_args.max_failures
+                    and not abort_marker(cache_dir).exists()
+                ):
+                    logging.error(
+                        "%d cuts failed, not installing the remaining slices.",
+                        failures,
+                    )
+                    abort_marker(cache_dir).touch()
+                    for f in futures:
+                        f.cancel()
+                job.installed |= task_result.installed
+                for cut in task_result.cuts:
+                    report.add(job, cut)
+                    usage.append((job.history_key()["release"], cut))
+                if history is not None:
+                    for cut in task_result.cuts:
+                        history.record(**job.history_key(), result=cut)
+                if results is not None:
+                    for cut in task_result.cuts:
+                        key = job.cut_keys.get(cut.slice_name)
+                        if key and cut.succeeded:
+                            results.add(key, cut.slice_name)
+                logging.debug("Finished %d/%d tasks.", n_done, len(futures))
+        if history is not None:
+            history.close()
+        if results is not None:
+            results.close()
+        report_resources(usage)
 
+    if not cli_args.dry_run:
+        for job in jobs:
+            report_coverage(job.all_slices, job.installed, job.name)
 
 if __name__ == "__main__":
     main()
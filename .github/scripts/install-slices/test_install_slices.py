@@ -4,24 +4,71 @@
 Tests for install_slices.py script
 """
 
+import argparse
+import fcntl
+import gzip
+import hashlib
+import io
+import json
 import logging
 import os
+import pathlib
+import shutil
+import tarfile
 import tempfile
+import time
 import unittest
 import unittest.mock
+import xml.etree.ElementTree as ET
+
+import zstandard
 
 from install_slices import (
-    CHISEL_PKG_CACHE,
+    parse_args,
     Package,
     Archive,
     parse_archive,
     full_slice_name,
     parse_package,
+    parse_packages,
+    find_slice_definitions,
+    read_files0,
+    log_listener,
+    worker_pool,
+    essentials_graph,
+    reduce_slices,
+    find_manifest_slice,
+    read_manifest,
+    CHISEL_MANIFEST,
+    report_coverage,
+    assign_files_to_releases,
     query_package_existence,
+    load_or_build_package_index,
+    PackageIndex,
     ensure_package_existence,
     ignore_missing_packages,
-    install_slice,
+    CutHistory,
+    ResultsCache,
+    cut_key,
+    CutResult,
+    chisel_cut,
+    retry_delay,
+    ArchiveBreaker,
+    shared_cache_lock,
+    make_batches,
+    package_tasks,
+    install_slices,
+    plan_release_jobs,
+    CutOptions,
+    abort_marker,
+    scratch_root,
+    _large_packages,
+    Job,
+    SliceReport,
     deb_has_copyright_file,
+    is_deb,
+    read_deb,
+    _deb_indices,
     main,
 )
 
@@ -93,6 +140,68 @@ DEFAULT_PACKAGE = Package(
 )
 
 
+def make_deb(
+    path: str,
+    pkg: str,
+    files: list[str],
+    compression: str = "gz",
+    arch: str = "amd64",
+    version: str = "1.0",
+) -> None:
+    """
+    Write a minimal deb of pkg containing the given (empty) files.
+    """
+
+    def _tarball(members: dict[str, bytes]) -> bytes:
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode=f"w:{compression}") as tar:
+            for name, content in members.items():
+                info = tarfile.TarInfo(f"./{name}")
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return buffer.getvalue()
+
+    control = (
+        f"Package: {pkg}\nVersion: {version}\nArchitecture: {arch}\n"
+        "Description: mock\n multiline\n"
+    )
+    members = [
+        ("debian-binary", b"2.0\n"),
+        (f"control.tar.{compression}", _tarball({"control": control.encode()})),
+        (f"data.tar.{compression}", _tarball({f: b"" for f in files})),
+    ]
+    with open(path, "wb") as f:
+        f.write(b"!<arch>\n")
+        for name, data in members:
+            header = f"{name:<16}{0:<12}{0:<6}{0:<6}{100644:<8}{len(data):<10}`\n"
+            f.write(header.encode())
+            f.write(data)
+            if len(data) % 2:
+                f.write(b"\n")
+
+
+def make_manifest(
+    root: str, paths: dict[str, list[str]], packages: dict[str, str] | None = None
+) -> None:
+    """
+    Write a chisel manifest in root, as generated by "base-files_chisel",
+    for the given paths and the slices which installed them, and for the
+    given packages and the sha256 of their debs.
+    """
+    slices = sorted({s for owners in paths.values() for s in owners})
+    entries = [
+        {"kind": "package", "name": n, "version": "1.0", "sha256": d, "arch": "amd64"}
+        for n, d in (packages or {}).items()
+    ]
+    entries += [{"kind": "path", "path": p, "slices": o} for p, o in paths.items()]
+    entries += [{"kind": "slice", "name": s} for s in slices]
+    header = {"jsonwall": "1.0", "schema": "1.0", "count": len(entries) + 1}
+    content = "".join(json.dumps(e) + "\n" for e in [header, *entries])
+    path = pathlib.Path(root) / CHISEL_MANIFEST
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(zstandard.ZstdCompressor().compress(content.encode()))
+
+
 class TestScriptMethods(unittest.TestCase):
     """
     Test the methods of install-slices
@@ -104,6 +213,31 @@ class TestScriptMethods(unittest.TestCase):
     def tearDown(self) -> None:
         logging.disable(logging.NOTSET)
 
+    def test_log_listener(self):
+        """
+        Test that log_listener() handles the log records of the workers
+        """
+        logging.disable(logging.NOTSET)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        root = logging.getLogger()
+        saved = root.handlers, root.level
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+        try:
+            with log_listener():
+                with worker_pool(2) as executor:
+                    executor.submit(
+                        logging.error, "====\n%s", "multi-line\nerror"
+                    ).result()
+                    executor.submit(logging.debug, "not logged").result()
+        finally:
+            root.handlers, root.level = saved
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].getMessage(), "====\nmulti-line\nerror")
+        self.assertNotEqual(records[0].process, os.getpid())
+
     def test_parse_archive(self):
         """
         Test parse_archive()
@@ -115,6 +249,10 @@ class TestScriptMethods(unittest.TestCase):
                 file.write(DEFAULT_CHISEL_YAML)
             archive = parse_archive(tmpfs)
             self.assertEqual(archive, DEFAULT_ARCHIVE)
+            self.assertEqual(
+                archive.digest,
+                hashlib.sha256(DEFAULT_CHISEL_YAML.encode()).hexdigest(),
+            )
         # test parsing remote release
         archive = parse_archive("ubuntu-22.04")
         self.assertEqual(archive, DEFAULT_ARCHIVE)
@@ -153,6 +291,234 @@ class TestScriptMethods(unittest.TestCase):
             pkg = parse_package(filepath)
             self.assertEqual(pkg, DEFAULT_PACKAGE)
 
+    def test_parse_packages(self):
+        """
+        Test parse_packages() and find_slice_definitions()
+        """
+        with tempfile.TemporaryDirectory() as tmpfs:
+            self.assertEqual(find_slice_definitions(tmpfs), [])
+            for i in range(10):
+                path = pathlib.Path(tmpfs, "slices", f"dir{i % 2}", f"hello{i}.yaml")
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(DEFAULT_PACKAGE_YAML.replace("hello", f"hello{i}"))
+            pathlib.Path(tmpfs, "slices", "README.md").write_text("not a SDF")
+            files = find_slice_definitions(tmpfs)
+            self.assertEqual(len(files), 10)
+            self.assertEqual(files, sorted(files))
+            # Parsing in parallel preserves the order of the files
+            serial = parse_packages(files)
+            parallel = parse_packages(files, workers=2)
+            self.assertEqual(parallel, serial)
+            self.assertEqual(
+                [p.package for p in parallel],
+                [os.path.basename(f).removesuffix(".yaml") for f in files],
+            )
+
+    def test_read_files0(self):
+        """
+        Test read_files0()
+        """
+        data = b"slices/a.yaml\0slices/b c.yaml\0slices/d\ne.yaml\0"
+        with tempfile.TemporaryDirectory() as tmpfs:
+            path = os.path.join(tmpfs, "files0")
+            with open(path, "wb") as f:
+                f.write(data)
+            expected = ["slices/a.yaml", "slices/b c.yaml", "slices/d\ne.yaml"]
+            self.assertEqual(read_files0(path), expected)
+            stdin = unittest.mock.Mock()
+            stdin.buffer = io.BytesIO(data)
+            with unittest.mock.patch("sys.stdin", stdin):
+                self.assertEqual(read_files0("-"), expected)
+
+    def test_reduce_slices(self):
+        """
+        Test essentials_graph() and reduce_slices()
+        """
+        libc6_yaml = """
+package: libc6
+essential:
+    - libc6_config
+slices:
+    config:
+        contents:
+    libs:
+        essential:
+            base-files_base: {arch: [amd64]}
+    bins:
+        essential:
+            - libc6_libs
+"""
+        with tempfile.TemporaryDirectory() as tmpfs:
+            filepath = os.path.join(tmpfs, "libc6.yaml")
+            with open(filepath, "w", encoding="utf-8") as file:
+                file.write(libc6_yaml)
+            libc6 = parse_package(filepath)
+        base_files = Package("base-files", ["base"], {"base": {}})
+        all_slices = [
+            ("base-files", "base"),
+            ("libc6", "bins"),
+            ("libc6", "config"),
+            ("libc6", "libs"),
+        ]
+        # libc6_bins installs everything on amd64
+        graph = essentials_graph([base_files, libc6], "amd64")
+        self.assertEqual(graph["libc6_config"], set())
+        self.assertEqual(graph["libc6_libs"], {"libc6_config", "base-files_base"})
+        roots = reduce_slices(all_slices, graph)
+        self.assertEqual(
+            roots,
+            {
+                ("libc6", "bins"): {
+                    "base-files_base",
+                    "libc6_bins",
+                    "libc6_config",
+                    "libc6_libs",
+                }
+            },
+        )
+        # base-files_base is not an essential on arm64
+        graph = essentials_graph([base_files, libc6], "arm64")
+        roots = reduce_slices(all_slices, graph)
+        self.assertEqual(
+            list(roots.keys()), [("base-files", "base"), ("libc6", "bins")]
+        )
+        # cycles of essentials are reduced to one slice
+        graph = {"a_x": {"b_y"}, "b_y": {"a_x"}}
+        roots = reduce_slices([("a", "x"), ("b", "y")], graph)
+        self.assertEqual(roots, {("a", "x"): {"a_x", "b_y"}})
+
+    def test_read_manifest(self):
+        """
+        Test find_manifest_slice() and read_manifest()
+        """
+        with tempfile.TemporaryDirectory() as tmpfs:
+            self.assertEqual(find_manifest_slice(tmpfs, [DEFAULT_PACKAGE]), "")
+            os.mkdir(os.path.join(tmpfs, "slices"))
+            with open(
+                os.path.join(tmpfs, "slices", "base-files.yaml"), "w", encoding="utf-8"
+            ) as f:
+                f.write("package: base-files\nslices:\n  base:\n  chisel:\n")
+            self.assertEqual(find_manifest_slice(tmpfs, []), "base-files_chisel")
+            # the parsed packages are used first
+            base_files = Package("base-files", ["base"])
+            self.assertEqual(find_manifest_slice(tmpfs, [base_files]), "")
+
+            root = os.path.join(tmpfs, "root")
+            self.assertIsNone(read_manifest(root))
+            make_manifest(
+                root,
+                {
+                    "/usr/bin/hello": ["hello_bins"],
+                    "/usr/share/doc/hello/copyright": ["hello_copyright"],
+                    "/var/lib/chisel/manifest.wall": ["base-files_chisel"],
+                },
+            )
+            manifest = read_manifest(root)
+            self.assertEqual(
+                manifest.slices, {"hello_bins", "hello_copyright", "base-files_chisel"}
+            )
+            self.assertEqual(
+                manifest.paths["/usr/share/doc/hello/copyright"], {"hello_copyright"}
+            )
+
+    def test_install_slices_manifest(self):
+        """
+        Test that install_slices() checks the installed slices and their
+        copyright files with the manifest of each cut
+        """
+
+        def fake_cut(*, root, slice_names, **kwargs):
+            owners = {"/usr/share/doc/foo/copyright": ["foo_copyright"]}
+            for name in slice_names:
+                owners.setdefault(f"/{name}", []).append(name)
+            if "broken_manifest" not in slice_names:
+                make_manifest(root, owners)
+            return CutResult(" ".join(slice_names), None, 1, 1.0)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            options = CutOptions(
+                "amd64",
+                "ubuntu-22.04",
+                "v1.0.0",
+                cache_dir,
+                batch_size=2,
+                manifest_slice="base-files_chisel",
+            )
+            with unittest.mock.patch(
+                "install_slices.chisel_cut", side_effect=fake_cut
+            ) as mock_cut, unittest.mock.patch(
+                "install_slices.deb_has_copyright_file", return_value=True
+            ):
+                # foo_bins does not install the copyright file on its own,
+                # although foo_copyright does in the same cut.
+                result = install_slices(
+                    [("foo", "bins"), ("foo", "copyright")],
+                    options,
+                    {
+                        "foo_bins": {"foo_bins": {"foo_bins"}},
+                        "foo_copyright": {"foo_copyright": {"foo_copyright"}},
+                    },
+                )
+                self.assertEqual(
+                    mock_cut.call_args.kwargs["slice_names"],
+                    ["foo_bins", "foo_copyright", "base-files_chisel"],
+                )
+                self.assertEqual(
+                    [(c.slice_name, c.status) for c in result.cuts],
+                    [("foo_bins", "copyright-missing"), ("foo_copyright", "passed")],
+                )
+                self.assertIn("base-files_chisel", result.installed)
+
+                # The copyright file installed by an essential of the slice
+                result = install_slices(
+                    [("foo", "bins")],
+                    options,
+                    {"foo_bins": {"foo_bins": {"foo_bins", "foo_copyright"}}},
+                )
+                self.assertEqual(result.cuts[0].status, "passed")
+
+                # A cut which does not generate the manifest fails
+                result = install_slices([("broken", "manifest")], options, {})
+                self.assertEqual(result.cuts[0].status, "failed")
+                self.assertEqual(result.installed, set())
+
+    def test_report_coverage(self):
+        """
+        Test report_coverage()
+        """
+        all_slices = [("libc6", "libs"), ("libc6", "config")]
+        self.assertEqual(
+            report_coverage(all_slices, {"libc6_libs", "libc6_config", "foo_bar"}),
+            [],
+        )
+        self.assertEqual(report_coverage(all_slices, {"libc6_libs"}), ["libc6_config"])
+
+    def test_assign_files_to_releases(self):
+        """
+        Test assign_files_to_releases()
+        """
+        files = ["slices/hello.yaml", "slices/libc6.yaml"]
+        self.assertEqual(
+            assign_files_to_releases(files, ["ubuntu-22.04"]),
+            {"ubuntu-22.04": files},
+        )
+        with tempfile.TemporaryDirectory() as tmpfs:
+            jammy = os.path.join(tmpfs, "jammy")
+            noble = os.path.join(tmpfs, "noble")
+            os.makedirs(os.path.join(jammy, "slices"))
+            os.makedirs(os.path.join(noble, "slices"))
+            jammy_file = os.path.join(jammy, "slices", "hello.yaml")
+            noble_file = os.path.join(noble, "slices", "hello.yaml")
+            self.assertEqual(
+                assign_files_to_releases([jammy_file, noble_file], [jammy, noble]),
+                {jammy: [jammy_file], noble: [noble_file]},
+            )
+            try:
+                assign_files_to_releases(["slices/hello.yaml"], [jammy, noble])
+                assert False
+            except SystemExit as e:
+                self.assertEqual(e.code, 1)
+
     def test_query_package_existence(self):
         """
         Test query_package_existence()
@@ -172,6 +538,83 @@ class TestScriptMethods(unittest.TestCase):
         self.assertEqual(found, ["libc6"])
         self.assertEqual(missing, ["foo123", "hello"])
 
+    def test_query_package_existence_local_mirror(self):
+        """
+        Test query_package_existence() with the Packages indices of a local mirror
+        """
+        indices = {
+            "jammy/main/binary-amd64/Packages.gz": gzip.compress(
+                b"Package: libc6\nArchitecture: amd64\nSHA256: 1111\n\n"
+                b"Package: hello\nArchitecture: amd64\nSHA256: 2222\n"
+            ),
+            "jammy-updates/universe/binary-i386/Packages": (
+                b"Package: libc6\nArchitecture: i386\n"
+            ),
+        }
+        with tempfile.TemporaryDirectory() as mirror:
+            for path, content in indices.items():
+                path = os.path.join(mirror, "dists", path)
+                os.makedirs(os.path.dirname(path))
+                with open(path, "wb") as file:
+                    file.write(content)
+            found, missing = query_package_existence(
+                packages=["libc6", "hello", "foo123"],
+                archive=DEFAULT_ARCHIVE,
+                mirror=mirror,
+            )
+            self.assertEqual(found, ["hello", "libc6"])
+            self.assertEqual(missing, ["foo123"])
+            # with specific arch
+            found, missing = query_package_existence(
+                packages=["libc6", "hello", "foo123"],
+                archive=DEFAULT_ARCHIVE,
+                arch=["i386"],
+                mirror=mirror,
+            )
+            self.assertEqual(found, ["libc6"])
+            self.assertEqual(missing, ["foo123", "hello"])
+            # the index answers for any arch and for a specific arch, and can
+            # be reused by other jobs
+            index_path = os.path.join(mirror, "index.json")
+            index = load_or_build_package_index(
+                DEFAULT_ARCHIVE, mirror=mirror, path=index_path
+            )
+            self.assertEqual(index.arches["libc6"], {"amd64", "i386"})
+            self.assertEqual(set(index.versions["amd64"]), {"libc6", "hello"})
+            self.assertNotEqual(
+                index.versions["amd64"]["libc6"], index.versions["amd64"]["hello"]
+            )
+            self.assertEqual(PackageIndex.load(index_path), index)
+            with unittest.mock.patch("install_slices.build_package_index") as mock_build:
+                loaded = load_or_build_package_index(
+                    DEFAULT_ARCHIVE, mirror=mirror, path=index_path
+                )
+                mock_build.assert_not_called()
+            self.assertEqual(loaded, index)
+            # an index of fewer arches is only reused for these arches
+            i386_path = os.path.join(mirror, "index-i386.json")
+            i386 = load_or_build_package_index(
+                DEFAULT_ARCHIVE, mirror=mirror, path=i386_path, arches=["i386"]
+            )
+            self.assertEqual(i386.arches, {"libc6": {"i386"}})
+            with unittest.mock.patch("install_slices.build_package_index") as mock_build:
+                load_or_build_package_index(
+                    DEFAULT_ARCHIVE, mirror=mirror, path=i386_path, arches=["i386"]
+                )
+                mock_build.assert_not_called()
+                load_or_build_package_index(
+                    DEFAULT_ARCHIVE, mirror=mirror, path=i386_path
+                )
+                mock_build.assert_called_once()
+            found, missing = query_package_existence(
+                packages=["libc6", "hello", "foo123"],
+                archive=DEFAULT_ARCHIVE,
+                arch=["i386"],
+                index=loaded,
+            )
+            self.assertEqual(found, ["libc6"])
+            self.assertEqual(missing, ["foo123", "hello"])
+
     def test_ensure_package_existence(self):
         """
         Test ensure_package_existence()
@@ -212,64 +655,707 @@ class TestScriptMethods(unittest.TestCase):
             ],
         )
 
-    def test_install_slice(self):
+    def test_shared_cache_lock(self):
         """
-        Test install_slice()
+        Test shared_cache_lock()
         """
-        mock_missing_copyright = set()
-        install_slice("libc6", "libs", "amd64", "ubuntu-22.04", mock_missing_copyright)
-        assert mock_missing_copyright == set()
-        #
-        try:
-            install_slice(
-                "foo123", "bar", "amd64", "ubuntu-22.04", mock_missing_copyright
+        with tempfile.TemporaryDirectory() as cache_dir:
+            locks_dir = os.path.join(cache_dir, "locks")
+            # A failed cut does not mark the keys as cached
+            with shared_cache_lock(cache_dir, ["index-amd64", "deb-amd64-hello"]):
+                pass
+            self.assertFalse(os.path.exists(os.path.join(locks_dir, "index-amd64.done")))
+            # A successful cut does
+            with shared_cache_lock(
+                cache_dir, ["index-amd64", "deb-amd64-hello"]
+            ) as mark_cached:
+                mark_cached()
+            self.assertTrue(os.path.exists(os.path.join(locks_dir, "index-amd64.done")))
+            self.assertTrue(
+                os.path.exists(os.path.join(locks_dir, "deb-amd64-hello.done"))
             )
-            assert False
-        except SystemExit as e:
-            self.assertEqual(e.code, 1)
+            # Cached keys are not locked any more
+            with unittest.mock.patch("fcntl.flock") as mock_flock:
+                with shared_cache_lock(cache_dir, ["index-amd64", "deb-amd64-libc6"]):
+                    pass
+                mock_flock.assert_called_once()
 
-    @unittest.mock.patch("os.popen")
-    @unittest.mock.patch("pathlib.Path.rglob")
-    @unittest.mock.patch("apt.debfile.DebPackage.__new__")
-    @unittest.mock.patch("magic.from_file")
-    def test_deb_has_copyright_file(
-        self, mock_magic, mock_debpackage, mock_rglob, mock_popen
-    ):
+    def test_make_batches(self):
         """
-        Test deb_has_copyright_file()
+        Test make_batches()
+        """
+        slices = [("a", "s1"), ("a", "s2"), ("b", "s1"), ("c", "s1"), ("c", "s2")]
+        self.assertEqual(make_batches(slices, 1), [[s] for s in slices])
+        self.assertEqual(
+            make_batches(slices, 2),
+            [[("a", "s1"), ("a", "s2")], [("b", "s1")], [("c", "s1"), ("c", "s2")]],
+        )
+        self.assertEqual(
+            make_batches(slices, 3),
+            [[("a", "s1"), ("a", "s2"), ("b", "s1")], [("c", "s1"), ("c", "s2")]],
+        )
+        self.assertEqual(make_batches(slices, 10), [slices])
+
+    def test_package_tasks(self):
+        """
+        Test package_tasks()
+        """
+        slices = [("a", "s1"), ("b", "s1"), ("a", "s2"), ("c", "s1")]
+        self.assertEqual(
+            package_tasks(slices, 10),
+            [[("a", "s1"), ("a", "s2")], [("b", "s1")], [("c", "s1")]],
+        )
+        # Huge packages are split evenly
+        slices = [("big", f"s{i}") for i in range(5)] + [("small", "s1")]
+        self.assertEqual(
+            [len(t) for t in package_tasks(slices, 2)],
+            [2, 2, 1, 1],
+        )
+        self.assertEqual(
+            [len(t) for t in package_tasks(slices, 4)],
+            [3, 2, 1],
+        )
+
+    def test_install_slices_bisect(self):
+        """
+        Test that install_slices() bisects failing batches
+        """
+
+        def fake_cut(*, slice_names, **kwargs):
+            error = "cannot cut b_s1" if "b_s1" in slice_names else None
+            return CutResult(" ".join(slice_names), error, 1, 4.0)
+
+        task = [("a", "s1"), ("a", "s2"), ("b", "s1"), ("c", "s1")]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            options = CutOptions(
+                "amd64", "ubuntu-22.04", "v1.0.0", cache_dir, batch_size=4
+            )
+            with unittest.mock.patch(
+                "install_slices.chisel_cut", side_effect=fake_cut
+            ) as mock_cut, unittest.mock.patch(
+                "install_slices.deb_has_copyright_file", return_value=False
+            ):
+                result = install_slices(task, options, {})
+        cut_names = [c.kwargs["slice_names"] for c in mock_cut.call_args_list]
+        self.assertEqual(
+            cut_names,
+            [
+                ["a_s1", "a_s2", "b_s1", "c_s1"],
+                ["a_s1", "a_s2"],
+                ["b_s1", "c_s1"],
+                ["b_s1"],
+                ["c_s1"],
+            ],
+        )
+        self.assertEqual(result.installed, {"a_s1", "a_s2", "c_s1"})
+        self.assertEqual(
+            [(c.slice_name, c.error) for c in result.cuts],
+            [
+                ("a_s1", None),
+                ("a_s2", None),
+                ("b_s1", "cannot cut b_s1"),
+                ("c_s1", None),
+            ],
+        )
+        self.assertEqual(result.cuts[0].duration, 2.0)
+
+    def test_install_slices_keep_going(self):
+        """
+        Test that install_slices() goes on after a failure, unless aborted
+        """
+
+        def fake_cut(*, slice_names, **kwargs):
+            error = "boom" if "fail" in slice_names[0] else None
+            return CutResult(" ".join(slice_names), error, 1, 1.0)
+
+        task = [("a", "fail1"), ("b", "s1"), ("c", "fail2"), ("d", "s1")]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            options = CutOptions(
+                "amd64", "ubuntu-22.04", "v1.0.0", cache_dir, version="22.04"
+            )
+            with unittest.mock.patch(
+                "install_slices.chisel_cut", side_effect=fake_cut
+            ), unittest.mock.patch(
+                "install_slices.deb_has_copyright_file", return_value=False
+            ):
+                result = install_slices(task, options, {})
+                self.assertEqual(result.installed, {"b_s1", "d_s1"})
+                self.assertEqual(
+                    [c.slice_name for c in result.cuts if c.error],
+                    ["a_fail1", "c_fail2"],
+                )
+                abort_marker(cache_dir).touch()
+                result = install_slices(task, options, {})
+                self.assertEqual(result.cuts, [])
+
+    def test_plan_release_jobs(self):
+        """
+        Test plan_release_jobs()
+        """
+        cli_args = argparse.Namespace(
+            workers=1,
+            ensure_existence=False,
+            ignore_missing=False,
+            existence_backend="index",
+            archive_mirror=None,
+            reduce_essentials=False,
+            results_cache=None,
+            chisel_version="v1.0.0",
+            dry_run=True,
+            batch_size=4,
+            scratch_max_size=512,
+        )
+        with tempfile.TemporaryDirectory() as release:
+            with open(os.path.join(release, "chisel.yaml"), "w", encoding="utf-8") as f:
+                f.write(DEFAULT_CHISEL_YAML)
+            os.mkdir(os.path.join(release, "slices"))
+            hello = os.path.join(release, "slices", "hello.yaml")
+            with open(hello, "w", encoding="utf-8") as f:
+                f.write(DEFAULT_PACKAGE_YAML)
+
+            def plan():
+                return plan_release_jobs(
+                    release, [hello], ["amd64"], cli_args, "/cache", "", None
+                )
+
+            # Without a manifest, the slices of a batch cannot be told apart
+            (job,) = plan()
+            self.assertEqual(job.options.batch_size, 1)
+            self.assertEqual(job.options.manifest_slice, "")
+            with self.assertRaises(SystemExit):
+                plan_release_jobs(
+                    release,
+                    [hello],
+                    ["amd64"],
+                    argparse.Namespace(**{**vars(cli_args), "reduce_essentials": True}),
+                    "/cache",
+                    "",
+                    None,
+                )
+
+            with open(
+                os.path.join(release, "slices", "base-files.yaml"), "w", encoding="utf-8"
+            ) as f:
+                f.write("package: base-files\nslices:\n  chisel:\n")
+            (job,) = plan()
+            self.assertEqual(job.options.batch_size, 4)
+            self.assertEqual(job.options.manifest_slice, "base-files_chisel")
+            self.assertEqual(job.roots, {("hello", "bins"): {"hello_bins"}})
+            # Without zstandard, the manifest cannot be read
+            with unittest.mock.patch("install_slices.zstandard", None):
+                (job,) = plan()
+                self.assertEqual(job.options.batch_size, 1)
+                self.assertEqual(job.options.manifest_slice, "")
+                with self.assertRaises(SystemExit):
+                    plan_release_jobs(
+                        release,
+                        [hello],
+                        ["amd64"],
+                        argparse.Namespace(
+                            **{**vars(cli_args), "reduce_essentials": True}
+                        ),
+                        "/cache",
+                        "",
+                        None,
+                    )
+            # A cut of a single slice is left as it is
+            cli_args.batch_size = 1
+            (job,) = plan()
+            self.assertEqual(job.options.manifest_slice, "")
+
+            # The files given are not parsed again with the rest of the release
+            cli_args.reduce_essentials = True
+            with unittest.mock.patch(
+                "install_slices.parse_package", wraps=parse_package
+            ) as parse:
+                plan()
+            self.assertEqual(
+                sorted(os.path.basename(c.args[0]) for c in parse.call_args_list),
+                ["base-files.yaml", "hello.yaml"],
+            )
+
+    def test_scratch_root(self):
+        """
+        Test scratch_root()
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            options = CutOptions(
+                "amd64",
+                "ubuntu-22.04",
+                "v1.0.0",
+                "/cache",
+                scratch_dir=scratch_dir,
+                scratch_max_bytes=1024,
+            )
+            # The scratch root is emptied and reused
+            with scratch_root(options, {"hello"}) as (root, on_scratch):
+                self.assertTrue(on_scratch)
+                self.assertTrue(root.startswith(scratch_dir))
+                os.makedirs(os.path.join(root, "usr/bin"))
+                os.symlink("bin", os.path.join(root, "usr/sbin"))
+                pathlib.Path(root, "etc").write_text("hello")
+            with scratch_root(options, {"hello"}) as (root2, on_scratch):
+                self.assertTrue(on_scratch)
+                self.assertEqual(root2, root)
+                self.assertEqual(os.listdir(root), [])
+
+            # Large packages are cut on disk
+            _large_packages.add("big")
+            try:
+                with scratch_root(options, {"hello", "big"}) as (root, on_scratch):
+                    self.assertFalse(on_scratch)
+                    self.assertFalse(root.startswith(scratch_dir))
+            finally:
+                _large_packages.discard("big")
+
+            # So are all the packages when there is not enough free space
+            huge = CutOptions(
+                "amd64",
+                "ubuntu-22.04",
+                "v1.0.0",
+                "/cache",
+                scratch_dir=scratch_dir,
+                scratch_max_bytes=2**62,
+            )
+            with scratch_root(huge, {"hello"}) as (root, on_scratch):
+                self.assertFalse(on_scratch)
+                self.assertTrue(os.path.isdir(root))
+
+    def test_slice_report(self):
+        """
+        Test SliceReport
+        """
+        archive = Archive("22.04", ["main"], ["jammy"])
+        options = CutOptions("amd64", "./", "v1.0.0", "/cache", version="22.04")
+        job = Job(archive, options, [], {})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            jsonl = os.path.join(tmpdir, "report.jsonl")
+            junit = os.path.join(tmpdir, "report.xml")
+            report = SliceReport(jsonl, junit)
+            report.add(
+                job, CutResult("libc6_libs", None, 1, 2.0, user_time=0.4, sys_time=0.1)
+            )
+            report.add(
+                job,
+                CutResult(
+                    "hello_bins",
+                    "error: boom",
+                    3,
+                    4.0,
+                    retry_pattern="cannot talk to archive",
+                ),
+            )
+            report.add(
+                job, CutResult("foo_bar", None, 1, 1.0, copyright_missing=["foo"])
+            )
+            report.add_cached(job, "bash_bins")
+            # Records are written as they are added
+            with open(jsonl) as f:
+                records = [json.loads(line) for line in f]
+            report.close()
+
+            self.assertEqual(
+                [(r["slice"], r["status"]) for r in records],
+                [
+                    ("libc6_libs", "passed"),
+                    ("hello_bins", "failed"),
+                    ("foo_bar", "copyright-missing"),
+                    ("bash_bins", "cached"),
+                ],
+            )
+            self.assertEqual(records[1]["retries"], 2)
+            self.assertEqual(records[1]["retry_pattern"], "cannot talk to archive")
+            self.assertEqual(records[1]["release"], "ubuntu-22.04")
+            self.assertEqual(records[1]["arch"], "amd64")
+            self.assertEqual(records[1]["chisel_version"], "v1.0.0")
+            self.assertEqual(records[0]["cpu_time"], 0.5)
+
+            suite = ET.parse(junit).getroot().find("testsuite")
+            self.assertEqual(suite.get("name"), "ubuntu-22.04/amd64")
+            self.assertEqual(suite.get("tests"), "4")
+            self.assertEqual(suite.get("failures"), "2")
+            self.assertEqual(suite.get("skipped"), "1")
+            failure = suite.find("testcase[@name='hello_bins']/failure")
+            self.assertEqual(failure.text, "error: boom")
+
+            # The slices installed by the cut of a root have their own records
+            job = Job(
+                archive,
+                options,
+                [],
+                {
+                    ("hello", "bins"): {"hello_bins", "hello_copyright", "libc6_libs"},
+                    ("bash", "bins"): {"bash_bins", "libc6_libs"},
+                },
+            )
+            report = SliceReport(jsonl, None)
+            report.add(
+                job,
+                CutResult("hello_bins", None, 1, 2.0, copyright_missing=["libc6"]),
+            )
+            report.add_cached(job, "bash_bins")
+            report.close()
+            self.assertEqual(
+                [(r["slice"], r["root"], r["status"]) for r in report.records],
+                [
+                    ("hello_bins", "hello_bins", "passed"),
+                    ("hello_copyright", "hello_bins", "passed"),
+                    ("libc6_libs", "hello_bins", "copyright-missing"),
+                    ("bash_bins", "bash_bins", "cached"),
+                    ("libc6_libs", "bash_bins", "cached"),
+                ],
+            )
+            # The usage of the cut is only attributed to the root
+            self.assertEqual(
+                [r["wall_time"] for r in report.records[:3]], [2.0, 0.0, 0.0]
+            )
+            self.assertEqual(report.records[2]["copyright_missing"], ["libc6"])
+
+    def test_chisel_cut(self):
+        """
+        Test chisel_cut() with a fake chisel
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bin_dir = os.path.join(tmpdir, "bin")
+            os.makedirs(bin_dir)
+            chisel = os.path.join(bin_dir, "chisel")
+            with open(chisel, "w") as f:
+                f.write(
+                    "#!/bin/sh\n"
+                    'mkdir -p "$XDG_CACHE_HOME/chisel/sha256" "$7/etc"\n'
+                    # the deb of the cut, and one downloaded by another worker
+                    'cp "$HELLO_DEB" "$XDG_CACHE_HOME/chisel/sha256/aaaa"\n'
+                    'cp "$OTHER_DEB" "$XDG_CACHE_HOME/chisel/sha256/bbbb"\n'
+                    'printf 1234 > "$7/etc/hello"\n'
+                    'ln -sf hello "$7/etc/link"\n'
+                    'if [ -n "$MANIFEST" ]; then\n'
+                    '  mkdir -p "$7/var/lib/chisel"\n'
+                    '  cp "$MANIFEST" "$7/var/lib/chisel/manifest.wall"\n'
+                    "fi\n"
+                    'case "$8" in *fail*)\n'
+                    '  echo "cannot talk to archive" >&2; exit 1;;\n'
+                    "esac\n"
+                )
+            os.chmod(chisel, 0o755)
+            root = os.path.join(tmpdir, "root")
+            cache_dir = os.path.join(tmpdir, "cache")
+            kwargs = dict(
+                arch="amd64",
+                release="ubuntu-22.04",
+                root=root,
+                chisel_version="v1.0.0",
+                cache_dir=cache_dir,
+            )
+            hello_deb = os.path.join(tmpdir, "hello.deb")
+            make_deb(hello_deb, "hello", ["usr/bin/hello"])
+            other_deb = os.path.join(tmpdir, "other.deb")
+            make_deb(other_deb, "other", ["usr/bin/other"])
+            env = {
+                "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+                "HELLO_DEB": hello_deb,
+                "OTHER_DEB": other_deb,
+                "MANIFEST": "",
+            }
+            with unittest.mock.patch.dict(
+                os.environ, env
+            ), unittest.mock.patch("install_slices.retry_delay", return_value=0):
+                cut = chisel_cut(slice_names=["hello_bins"], **kwargs)
+                self.assertIsNone(cut.error)
+                self.assertEqual(cut.attempts, 1)
+                # Only the deb of the cut is charged to it
+                self.assertEqual(cut.cache_bytes, os.path.getsize(hello_deb))
+                self.assertEqual(cut.root_bytes, 4)
+                self.assertGreater(cut.peak_rss, 0)
+                self.assertGreaterEqual(cut.cpu_time, 0.0)
+
+                shutil.rmtree(root)
+                lock_path = os.path.join(cache_dir, "locks", "deb-fail.lock")
+
+                def check_unlocked(delay):
+                    # The backoff happens without holding the lock
+                    with open(lock_path, "w") as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+                with unittest.mock.patch(
+                    "install_slices.time.sleep", side_effect=check_unlocked
+                ) as sleep:
+                    cut = chisel_cut(
+                        slice_names=["hello_fail"],
+                        cache_keys=["deb-fail"],
+                        n_retries=2,
+                        **kwargs,
+                    )
+                    sleep.assert_called_once()
+                self.assertEqual(cut.error, "cannot talk to archive")
+                self.assertEqual(cut.attempts, 2)
+                self.assertEqual(cut.retry_pattern, "cannot talk to archive")
+                # The object was already in the cache
+                self.assertEqual(cut.cache_bytes, 0)
+                # The archive was not reached, so the key is still cold
+                locks_dir = pathlib.Path(cache_dir, "locks")
+                self.assertFalse((locks_dir / "deb-fail.done").exists())
+
+                shutil.rmtree(root)
+                chisel_cut(
+                    slice_names=["hello_bins"], cache_keys=["deb-hello"], **kwargs
+                )
+                self.assertTrue((locks_dir / "deb-hello.done").exists())
+
+                # The debs installed by the cut are listed in its manifest
+                shutil.rmtree(root)
+                shutil.rmtree(cache_dir)
+                manifest_root = os.path.join(tmpdir, "manifest")
+                make_manifest(
+                    manifest_root, {"/etc/hello": ["other_bins"]}, {"other": "bbbb"}
+                )
+                os.environ["MANIFEST"] = os.path.join(manifest_root, CHISEL_MANIFEST)
+                cut = chisel_cut(slice_names=["other_bins"], **kwargs)
+                self.assertEqual(cut.cache_bytes, os.path.getsize(other_deb))
+
+    def test_retry_delay(self):
+        """
+        Test retry_delay()
+        """
+        for attempt, cap in [(1, 2.0), (2, 4.0), (3, 8.0), (10, 60.0)]:
+            delays = [retry_delay(attempt) for _ in range(50)]
+            self.assertTrue(all(0 <= d <= cap for d in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+    def test_archive_breaker(self):
+        """
+        Test ArchiveBreaker
         """
-        # No files, nothing to do
-        mock_rglob.return_value = []
-        assert deb_has_copyright_file("mock_pkg") == False
-        mock_debpackage.assert_not_called()
-
-        # If SHA exists but is not a deb, we skip
-        mock_rglob.return_value = ["fake_sha"]
-        mock_magic.return_value = "not-a-deb"
-        assert deb_has_copyright_file("mock_pkg") == False
-        mock_magic.assert_called_once_with("fake_sha", mime=True)
-        mock_popen.assert_not_called()
-
-        # If the deb exists but the pkg doesn't match, we skip
-        mock_magic.return_value = "debian.binary-package"
-        mock_popen.return_value.read.return_value = "bad-pkg-name"
-        assert deb_has_copyright_file("mock_pkg") == False
-        mock_popen.assert_called_once_with(
-            f"dpkg-deb -f {str(CHISEL_PKG_CACHE) + '/fake_sha'} Package"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pathlib.Path(tmpdir) / "breaker.json"
+            breaker = ArchiveBreaker(path, threshold=2, window=10.0, cooldown=0.1)
+            # Closed
+            self.assertFalse(breaker.wait())
+            breaker.record(archive_error=True)
+            breaker.record(archive_error=False)
+            self.assertFalse(breaker.wait())
+            # Opens after threshold errors within the window, then lets a
+            # single worker probe once the cooldown expired.
+            breaker.record(archive_error=True)
+            start = time.monotonic()
+            self.assertTrue(breaker.wait())
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            # A failed probe opens it again for longer
+            breaker.record(archive_error=True)
+            state = json.loads(path.read_text())
+            self.assertEqual(state["cooldown"], 0.2)
+            self.assertTrue(breaker.wait())
+            # A successful probe closes it
+            breaker.record(archive_error=False)
+            state = json.loads(path.read_text())
+            self.assertEqual(state["open_until"], 0.0)
+            self.assertEqual(state["failures"], [])
+            self.assertFalse(breaker.wait())
+
+    def test_cut_history(self):
+        """
+        Test CutHistory
+        """
+        key = {"release": "ubuntu-22.04", "chisel_version": "v1.2.0"}
+        with tempfile.TemporaryDirectory() as tmpfs:
+            history = CutHistory(os.path.join(tmpfs, "history.db"))
+            # no history
+            self.assertEqual(
+                history.estimate(**key, arch="amd64", slice_name="libc6_libs"),
+                CutHistory.DEFAULT_ESTIMATE,
+            )
+            history.record(
+                **key, arch="amd64", result=CutResult("libc6_libs", None, 1, 4.0)
+            )
+            history.record(
+                **key, arch="arm64", result=CutResult("libc6_libs", "err", 3, 8.0)
+            )
+            self.assertEqual(
+                history.estimate(**key, arch="amd64", slice_name="libc6_libs"), 4.0
+            )
+            # other arches are averaged
+            self.assertEqual(
+                history.estimate(**key, arch="s390x", slice_name="libc6_libs"), 6.0
+            )
+            # the last record wins
+            history.record(
+                **key, arch="amd64", result=CutResult("libc6_libs", None, 1, 2.0)
+            )
+            self.assertEqual(
+                history.estimate(**key, arch="amd64", slice_name="libc6_libs"), 2.0
+            )
+            history.close()
+
+    def test_results_cache(self):
+        """
+        Test cut_key() and ResultsCache
+        """
+        graph = {"hello_bins": {"libc6_libs"}, "libc6_libs": set()}
+        digests = {"hello": "1234", "libc6": "5678"}
+        key_args = {
+            "slice_name": "hello_bins",
+            "graph": graph,
+            "digests": digests,
+            "chisel_version": "v1.2.0",
+            "arch": "amd64",
+            "config": "abcd",
+            "versions": {"hello": "1111", "libc6": "2222"},
+        }
+        key = cut_key(**key_args)
+        self.assertEqual(key, cut_key(**key_args))
+        # any change of the inputs changes the key
+        for arg, value in (
+            ("digests", {"hello": "1234", "libc6": "0000"}),
+            ("chisel_version", "v1.3.0"),
+            ("arch", "arm64"),
+            ("config", "efgh"),
+            ("versions", {"hello": "1111", "libc6": "3333"}),
+        ):
+            self.assertNotEqual(key, cut_key(**{**key_args, arg: value}))
+        # unrelated slice definition files and packages do not change the key
+        self.assertEqual(
+            key, cut_key(**{**key_args, "digests": {**digests, "foo": "9999"}})
+        )
+        self.assertEqual(
+            key,
+            cut_key(**{**key_args, "versions": {**key_args["versions"], "foo": "9"}}),
         )
-        mock_debpackage.assert_not_called()
-
-        # If the deb exists and matches, then return True is copyright exists
-        mock_popen.return_value.read.return_value = "mock_pkg"
-        mock_deb = unittest.mock.MagicMock()
-        mock_deb.filelist = "no\ncopyright\nfile"
-        mock_debpackage.return_value = mock_deb
-        assert deb_has_copyright_file("mock_pkg") == False
-        mock_debpackage.assert_called_once()
-
-        mock_deb.filelist = "something\nusr/share/doc/mock_pkg/copyright\nextra"
-        mock_debpackage.return_value = mock_deb
-        assert deb_has_copyright_file("mock_pkg") == True
+        # no key if a slice definition file is unknown
+        self.assertIsNone(cut_key(**{**key_args, "digests": {"hello": "1234"}}))
+
+        with tempfile.TemporaryDirectory() as tmpfs:
+            results = ResultsCache(os.path.join(tmpfs, "results.db"))
+            self.assertFalse(results.has(key))
+            results.add(key, "hello_bins")
+            self.assertTrue(results.has(key))
+            results.close()
+
+    def test_read_deb(self):
+        """
+        Test is_deb() and read_deb()
+        """
+        with tempfile.TemporaryDirectory() as tmpfs:
+            for compression in ("gz", "xz"):
+                deb_path = os.path.join(tmpfs, f"hello.{compression}.deb")
+                make_deb(
+                    deb_path,
+                    "hello",
+                    ["usr/bin/hello", "usr/share/doc/hello/copyright"],
+                    compression,
+                )
+                self.assertTrue(is_deb(deb_path))
+                deb = read_deb(deb_path)
+                self.assertEqual(deb.control["Package"], "hello")
+                self.assertEqual(deb.control["Description"], "mock\nmultiline")
+                self.assertIn("usr/share/doc/hello/copyright", deb.files)
+                self.assertIn("usr/bin/hello", deb.files)
+                self.assertEqual(read_deb(deb_path, files=False).files, [])
+            not_a_deb = os.path.join(tmpfs, "not-a-deb")
+            with open(not_a_deb, "w", encoding="utf-8") as file:
+                file.write(DEFAULT_PACKAGE_YAML)
+            self.assertFalse(is_deb(not_a_deb))
+
+    def test_deb_has_copyright_file(self):
+        """
+        Test deb_has_copyright_file()
+        """
+        _deb_indices.clear()
+        with tempfile.TemporaryDirectory() as pkg_cache:
+            pkg_cache = pathlib.Path(pkg_cache)
+            # No files, nothing to do
+            assert deb_has_copyright_file("mock_pkg", pkg_cache) == False
+
+            # If SHA exists but is not a deb, we skip
+            with open(pkg_cache / "fake_sha", "w", encoding="utf-8") as file:
+                file.write("not-a-deb")
+            assert deb_has_copyright_file("mock_pkg", pkg_cache) == False
+
+            # If the deb exists but the pkg doesn't match, we skip
+            make_deb(
+                pkg_cache / "bad_sha",
+                "bad-pkg-name",
+                ["usr/share/doc/mock_pkg/copyright"],
+            )
+            assert deb_has_copyright_file("mock_pkg", pkg_cache) == False
+
+            # If the deb exists and matches, then return True is copyright exists
+            make_deb(pkg_cache / "mock_sha", "mock_pkg", ["no/copyright/file"])
+            assert deb_has_copyright_file("mock_pkg", pkg_cache) == False
+
+            make_deb(
+                pkg_cache / "other_sha",
+                "other_pkg",
+                ["something", "usr/share/doc/other_pkg/copyright", "extra"],
+            )
+            assert deb_has_copyright_file("other_pkg", pkg_cache) == True
+
+            # The index is reused: the debs are only read once
+            with unittest.mock.patch("install_slices.read_deb") as mock_read_deb:
+                assert deb_has_copyright_file("other_pkg", pkg_cache) == True
+                assert deb_has_copyright_file("mock_pkg", pkg_cache) == False
+                mock_read_deb.assert_not_called()
+
+            # The deb of the requested arch and version is inspected
+            make_deb(
+                pkg_cache / "arm64_sha",
+                "mock_pkg",
+                ["usr/share/doc/mock_pkg/copyright"],
+                arch="arm64",
+            )
+            make_deb(
+                pkg_cache / "new_sha",
+                "mock_pkg",
+                ["usr/share/doc/mock_pkg/copyright"],
+                version="2.0",
+            )
+            assert deb_has_copyright_file("mock_pkg", pkg_cache, "amd64", "1.0") == False
+            assert deb_has_copyright_file("mock_pkg", pkg_cache, "arm64", "1.0") == True
+            assert deb_has_copyright_file("mock_pkg", pkg_cache, "amd64", "2.0") == True
+            assert deb_has_copyright_file("mock_pkg", pkg_cache, "s390x") == False
+            make_deb(
+                pkg_cache / "all_sha",
+                "doc_pkg",
+                ["usr/share/doc/doc_pkg/copyright"],
+                arch="all",
+            )
+            assert deb_has_copyright_file("doc_pkg", pkg_cache, "s390x") == True
+
+    def test_parse_args_max_failures(self):
+        """
+        Test that parse_args() rejects a --max-failures below 1
+        """
+        args = ["", "--arch", "amd64", "--release", "/tmp", "hello.yaml"]
+        with unittest.mock.patch("sys.argv", args + ["--max-failures", "1"]):
+            self.assertEqual(parse_args().max_failures, 1)
+        for value in ("0", "-1"):
+            with unittest.mock.patch(
+                "sys.argv", args + ["--max-failures", value]
+            ), unittest.mock.patch("sys.stderr", io.StringIO()):
+                with self.assertRaises(SystemExit) as cm:
+                    parse_args()
+                self.assertEqual(cm.exception.code, 2)
+
+    def test_parse_args_releases(self):
+        """
+        Test that parse_args() rejects files with several branch releases
+        """
+        with tempfile.TemporaryDirectory() as release_dir:
+            args = ["", "--arch", "amd64", "--release", release_dir]
+            with unittest.mock.patch(
+                "sys.argv", args + ["--release-dir", release_dir, "hello.yaml"]
+            ):
+                self.assertEqual(parse_args().release, [release_dir])
+            for extra in (["hello.yaml"], ["--files0-from", "-"]):
+                with unittest.mock.patch(
+                    "sys.argv", args + ["--release", "ubuntu-22.04", *extra]
+                ), unittest.mock.patch("sys.stderr", io.StringIO()):
+                    with self.assertRaises(SystemExit) as cm:
+                        parse_args()
+                    self.assertEqual(cm.exception.code, 2)
+            # Without files, nothing has to be assigned to the releases
+            with unittest.mock.patch(
+                "sys.argv", args + ["--release", "ubuntu-22.04"]
+            ):
+                self.assertEqual(len(parse_args().release), 2)
 
     def test_main(self):
         """